@@ -0,0 +1,53 @@
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from microfastapitodowebapp.model.todo_response import TodoResponse  # noqa: E402
+
+
+def build_page(size: int) -> bytes:
+    todos = [{
+        "id": i, "title": f"Todo {i}", "description": f"Load test todo number {i} " * 4,
+        "deadline": "2026-10-10T10:00:00Z", "completed": i % 3 == 0, "shared": i % 7 == 0, "priority": i % 5,
+        "categories": [f"category-{i % 4}", "load-test"], "accessLevel": 3,
+        "createdAt": "2026-01-01T08:30:00.123456Z", "updatedAt": "2026-01-02T09:45:00.654321Z",
+    } for i in range(size)]
+    page = {"size": size, "number": 0, "totalElements": size * 5, "totalPages": 5}
+    return json.dumps({"content": todos, "page": page}).encode()
+
+
+def decode(content: bytes) -> TodoResponse:
+    return TodoResponse.from_json(content)
+
+
+def decode_and_render_fields(content: bytes) -> None:
+    # The fields the todo card reads
+    for todo in TodoResponse.from_json(content).content:
+        (todo.id, todo.title, todo.description, todo.completed, todo.priority, todo.categories,
+         todo.deadline_date, todo.deadline_time)
+
+
+def measure(func, content: bytes, number: int) -> float:
+    return min(timeit.repeat(lambda: func(content), number=number, repeat=5)) / number * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time decoding of Todo API list pages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 250, 500])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'page size':>10}{'json.loads ms':>15}{'decode ms':>12}{'decode + card fields ms':>26}")
+    for size in args.sizes:
+        content = build_page(size)
+        print(f"{size:>10}{measure(json.loads, content, args.number):>15.3f}"
+              f"{measure(decode, content, args.number):>12.3f}"
+              f"{measure(decode_and_render_fields, content, args.number):>26.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import asyncio
+import base64
+import itertools
+import json
+import re
+import secrets
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, RedirectResponse, Response
+from starlette.routing import Route
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+REALM_PATH: str = "/realms/todo/protocol/openid-connect"
+CLIENT_ID: str = "todo-web"
+KEY_ID: str = "load-test"
+ACCESS_TOKEN_LIFETIME: int = 300
+REFRESH_TOKEN_LIFETIME: int = 1800
+SEARCH_PATTERN = re.compile(r"title=ilike='([^']*)'")
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def b64url_int(value: int) -> str:
+    return b64url(value.to_bytes((value.bit_length() + 7) // 8, "big"))
+
+
+def isoformat(value: datetime) -> str:
+    return value.isoformat().replace("+00:00", "Z")
+
+
+class LatencyMiddleware:
+    # Simulated network and database time of the real services
+    def __init__(self, app: ASGIApp, latency: float):
+        self.app = app
+        self.latency = latency
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and self.latency > 0:
+            await asyncio.sleep(self.latency)
+        await self.app(scope, receive, send)
+
+
+class FakeKeycloak:
+    def __init__(self, issuer: str):
+        self.issuer = issuer
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.user_ids = itertools.count(1)
+        # code -> (sub, nonce), access token -> sub, refresh token -> sub
+        self.codes: dict[str, tuple[str, str | None]] = {}
+        self.access_tokens: dict[str, str] = {}
+        self.refresh_tokens: dict[str, str] = {}
+
+    def sign(self, claims: dict) -> str:
+        header = {"alg": "RS256", "typ": "JWT", "kid": KEY_ID}
+        signing_input = (b64url(json.dumps(header).encode()) + "." + b64url(json.dumps(claims).encode())).encode()
+        signature = self.key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+        return signing_input.decode() + "." + b64url(signature)
+
+    def issue_token(self, sub: str, nonce: str | None = None) -> dict:
+        now = int(time.time())
+        access_token = secrets.token_urlsafe(24)
+        refresh_token = secrets.token_urlsafe(24)
+        self.access_tokens[access_token] = sub
+        self.refresh_tokens[refresh_token] = sub
+        token = {
+            "access_token": access_token,
+            "token_type": "Bearer",
+            "expires_in": ACCESS_TOKEN_LIFETIME,
+            "refresh_expires_in": REFRESH_TOKEN_LIFETIME,
+            "refresh_token": refresh_token,
+            "scope": "openid email profile",
+        }
+        if nonce is not None:
+            token["id_token"] = self.sign({
+                "iss": self.issuer, "aud": CLIENT_ID, "sub": sub, "iat": now, "exp": now + ACCESS_TOKEN_LIFETIME,
+                "nonce": nonce, "email": f"{sub}@load.test", "preferred_username": sub,
+            })
+        return token
+
+    def user_of(self, request: Request) -> str | None:
+        scheme, _, access_token = request.headers.get("authorization", "").partition(" ")
+        return self.access_tokens.get(access_token) if scheme.lower() == "bearer" else None
+
+    async def authorize(self, request: Request):
+        # Every login is a new user, there is no login form
+        sub = f"user-{next(self.user_ids)}"
+        code = secrets.token_urlsafe(16)
+        self.codes[code] = (sub, request.query_params.get("nonce"))
+        redirect = f"{request.query_params['redirect_uri']}?code={code}&state={request.query_params['state']}"
+        return RedirectResponse(redirect, status_code=302)
+
+    async def token(self, request: Request):
+        form = await request.form()
+        if form.get("grant_type") == "authorization_code":
+            sub, nonce = self.codes.pop(form.get("code"), (None, None))
+            if sub is None:
+                return JSONResponse({"error": "invalid_grant"}, status_code=400)
+            return JSONResponse(self.issue_token(sub, nonce))
+        if form.get("grant_type") == "refresh_token":
+            sub = self.refresh_tokens.get(form.get("refresh_token"))
+            if sub is None:
+                return JSONResponse({"error": "invalid_grant"}, status_code=400)
+            return JSONResponse(self.issue_token(sub))
+        return JSONResponse({"error": "unsupported_grant_type"}, status_code=400)
+
+    async def certs(self, request: Request):
+        numbers = self.key.public_key().public_numbers()
+        return JSONResponse({"keys": [{
+            "kty": "RSA", "kid": KEY_ID, "use": "sig", "alg": "RS256",
+            "n": b64url_int(numbers.n), "e": b64url_int(numbers.e),
+        }]})
+
+
+class FakeTodoApi:
+    def __init__(self, keycloak: FakeKeycloak, todos_per_user: int):
+        self.keycloak = keycloak
+        self.todos_per_user = todos_per_user
+        self.ids = itertools.count(1)
+        self.todos: dict[str, dict[int, dict]] = {}
+        self.shares: dict[int, dict[str, int]] = defaultdict(dict)
+
+    def new_todo(self, data: dict) -> dict:
+        now = isoformat(datetime.now(timezone.utc))
+        return {
+            "id": next(self.ids), "title": data.get("title"), "description": data.get("description"),
+            "deadline": data.get("deadline"), "completed": bool(data.get("completed")), "shared": False,
+            "priority": data.get("priority") or 0, "categories": data.get("categories") or [], "accessLevel": 3,
+            "createdAt": now, "updatedAt": now,
+        }
+
+    def user_todos(self, sub: str) -> dict[int, dict]:
+        if sub not in self.todos:
+            deadline = datetime.now(timezone.utc) + timedelta(days=7)
+            todos = (self.new_todo({
+                "title": f"Todo {i}", "description": f"Load test todo number {i} " * 4,
+                "deadline": isoformat(deadline + timedelta(hours=i)), "completed": i % 3 == 0,
+                "priority": i % 5, "categories": [f"category-{i % 4}", "load-test"],
+            }) for i in range(self.todos_per_user))
+            self.todos[sub] = {todo["id"]: todo for todo in todos}
+        return self.todos[sub]
+
+    def filtered(self, sub: str, request: Request) -> list[dict]:
+        todos = list(self.user_todos(sub).values())
+        match = SEARCH_PATTERN.search(request.query_params.get("search", ""))
+        if match:
+            text = match.group(1).strip("%*").lower()
+            todos = [todo for todo in todos if text in (todo["title"] or "").lower()]
+        return todos
+
+    @staticmethod
+    def statistics(todos: list[dict]) -> dict:
+        finished = sum(1 for todo in todos if todo["completed"])
+        return {"total": len(todos), "finished": finished, "unfinished": len(todos) - finished}
+
+    def find(self, request: Request) -> tuple[str | None, dict | None]:
+        sub = self.keycloak.user_of(request)
+        if sub is None:
+            return None, None
+        return sub, self.user_todos(sub).get(int(request.path_params["todo_id"]))
+
+    async def list_todos(self, request: Request):
+        sub = self.keycloak.user_of(request)
+        if sub is None:
+            return Response(status_code=401)
+        todos = self.filtered(sub, request)
+        page_number = int(request.query_params.get("pageNumber", 0))
+        page_size = int(request.query_params.get("pageSize", 20))
+        content = todos[page_number * page_size:(page_number + 1) * page_size]
+        return JSONResponse({"content": content, "page": {
+            "size": page_size, "number": page_number, "totalElements": len(todos),
+            "totalPages": (len(todos) + page_size - 1) // page_size,
+        }})
+
+    async def create_todo(self, request: Request):
+        sub = self.keycloak.user_of(request)
+        if sub is None:
+            return Response(status_code=401)
+        todo = self.new_todo(await request.json())
+        self.user_todos(sub)[todo["id"]] = todo
+        return JSONResponse(todo, status_code=201)
+
+    async def todo(self, request: Request):
+        sub, todo = self.find(request)
+        if sub is None:
+            return Response(status_code=401)
+        if todo is None:
+            return Response(status_code=404)
+        if request.method == "DELETE":
+            del self.user_todos(sub)[todo["id"]]
+            self.shares.pop(todo["id"], None)
+            return Response(status_code=204)
+        if request.method in ("PUT", "PATCH"):
+            data = await request.json()
+            todo.update({key: value for key, value in data.items()
+                         if key in todo and (value is not None or request.method == "PUT")})
+            todo["updatedAt"] = isoformat(datetime.now(timezone.utc))
+        return JSONResponse(todo)
+
+    async def share(self, request: Request):
+        sub, todo = self.find(request)
+        if sub is None:
+            return Response(status_code=401)
+        if todo is None:
+            return Response(status_code=404)
+        shares = self.shares[todo["id"]]
+        if request.method == "PUT":
+            data = await request.json()
+            shares[data["email"]] = data["accessLevel"]
+        elif request.method == "DELETE":
+            shares.pop(request.query_params.get("email"), None)
+        else:
+            content = [{"email": email, "accessLevel": level} for email, level in shares.items()]
+            return JSONResponse({"content": content, "page": {
+                "size": 20, "number": 0, "totalElements": len(content), "totalPages": 1,
+            }})
+        todo["shared"] = bool(shares)
+        return Response(status_code=204)
+
+    async def statistics_endpoint(self, request: Request):
+        sub = self.keycloak.user_of(request)
+        if sub is None:
+            return Response(status_code=401)
+        todos = self.filtered(sub, request)
+        group_by = request.query_params.get("groupBy")
+        if group_by is None:
+            return JSONResponse(self.statistics(todos))
+        groups: dict[str, list[dict]] = defaultdict(list)
+        for todo in todos:
+            keys = todo["categories"] if group_by == "category" else [str(todo.get(group_by))]
+            for key in keys:
+                groups[key].append(todo)
+        return JSONResponse({key: self.statistics(value) for key, value in groups.items()})
+
+
+def create_fake_upstream(base_url: str, todos_per_user: int = 200, latency: float = 0.0) -> Starlette:
+    keycloak = FakeKeycloak(issuer=f"{base_url}/realms/todo")
+    api = FakeTodoApi(keycloak, todos_per_user)
+    return Starlette(routes=[
+        Route(f"{REALM_PATH}/auth", keycloak.authorize),
+        Route(f"{REALM_PATH}/token", keycloak.token, methods=["POST"]),
+        Route(f"{REALM_PATH}/certs", keycloak.certs),
+        Route("/api/v1/todos", api.list_todos),
+        Route("/api/v1/todos", api.create_todo, methods=["POST"]),
+        Route("/api/v1/todos/statistics", api.statistics_endpoint),
+        Route("/api/v1/todos/{todo_id:int}", api.todo, methods=["GET", "PUT", "PATCH", "DELETE"]),
+        Route("/api/v1/todos/{todo_id:int}/share", api.share, methods=["GET", "PUT", "DELETE"]),
+    ], middleware=[Middleware(LatencyMiddleware, latency=latency)])
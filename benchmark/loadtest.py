@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+from fake_upstream import CLIENT_ID, REALM_PATH, create_fake_upstream
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DRAWER_LINK = re.compile(r"/dashboard/partials/drawer/(\d+)")
+HTMX_HEADERS = {"HX-Request": "true"}
+SEARCH_TERMS = ("Todo 1", "Todo 2", "todo 3", "nothing matches")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_workspace(workspace: Path, upstream_url: str, valkey_host: str, valkey_port: int) -> None:
+    # The app reads .env and local-config/ from its working directory, the same layout as a local checkout
+    config = workspace / "local-config"
+    config.mkdir()
+    realm = f"{upstream_url}/realms/todo"
+    (config / "service.properties").write_text("\n".join([
+        f"applicationClientId={CLIENT_ID}",
+        "applicationClientSecretName=clientSecret",
+        "valkeyUsernameSecretName=valkeyUsername",
+        "valkeyPasswordSecretName=valkeyPassword",
+        f"valkeyHostname={valkey_host}",
+        f"valkeyPort={valkey_port}",
+        f"todoApiBaseUrl={upstream_url}",
+        "authorizationServerHost=127.0.0.1",
+        f"authorizationServerIssuerUri={realm}",
+        f"authorizationServerUri={upstream_url}{REALM_PATH}/auth",
+        f"authorizationServerTokenUri={upstream_url}{REALM_PATH}/token",
+        f"authorizationServerJwksUri={upstream_url}{REALM_PATH}/certs",
+    ]) + "\n")
+    (config / "oauth.properties").write_text("clientSecret=load-test\n")
+    (config / "valkey.properties").write_text("username=default\npassword=\n")
+    (workspace / ".env").write_text("CONFIG_DIRECTORY=local-config\nSECRET_PROVIDER=local-config\n")
+    (workspace / "src").symlink_to(REPO_ROOT / "src", target_is_directory=True)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.enabled = False
+        self.started = 0.0
+        self.stopped = 0.0
+
+    def start(self) -> None:
+        self.enabled = True
+        self.started = time.perf_counter()
+
+    def stop(self) -> None:
+        self.enabled = False
+        self.stopped = time.perf_counter()
+
+    def record(self, route: str, seconds: float, ok: bool) -> None:
+        if not self.enabled:
+            return
+        self.samples[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    def report(self) -> dict[str, dict[str, float]]:
+        elapsed = max(self.stopped - self.started, 1e-9)
+        routes = dict(self.samples)
+        routes["TOTAL"] = [sample for samples in self.samples.values() for sample in samples]
+        report = {}
+        for route, samples in sorted(routes.items()):
+            samples = sorted(samples)
+            errors = sum(self.errors.values()) if route == "TOTAL" else self.errors[route]
+            report[route] = {
+                "requests": len(samples),
+                "errors": errors,
+                "throughput": len(samples) / elapsed,
+                "p50": percentile(samples, 0.50) * 1000,
+                "p95": percentile(samples, 0.95) * 1000,
+                "p99": percentile(samples, 0.99) * 1000,
+                "max": (samples[-1] if samples else 0.0) * 1000,
+            }
+        return report
+
+
+class VirtualUser:
+    def __init__(self, base_url: str, recorder: Recorder, think_time: float):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=30, event_hooks={"response": [self.keep_session]})
+        self.recorder = recorder
+        self.think_time = think_time
+        self.todo_ids: list[int] = []
+        self.email = ""
+
+    async def keep_session(self, response: httpx.Response) -> None:
+        # The session cookie is Secure, which the cookie jar would not send over plain HTTP
+        session = response.cookies.get("session")
+        if session:
+            self.client.headers["Cookie"] = f"session={session}"
+
+    async def login(self) -> None:
+        # Real authorization code flow against the fake Keycloak, so the session is created by the app itself
+        response = await self.client.get("/login")
+        # Followed by hand, redirected requests would not pick up the session header
+        while response.is_redirect:
+            response = await self.client.get(response.headers["location"])
+        response.raise_for_status()
+        if "Cookie" not in self.client.headers:
+            raise RuntimeError("Login did not create a session")
+        await self.load_dashboard()
+        if not self.todo_ids:
+            raise RuntimeError("Dashboard did not list any todos")
+
+    async def request(self, route: str, method: str, url: str, htmx: bool = True, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=HTMX_HEADERS if htmx else None, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(route, time.perf_counter() - started, ok=False)
+            raise
+        # An hx-redirect means the session was lost
+        ok = response.status_code < 400 and "hx-redirect" not in response.headers
+        self.recorder.record(route, time.perf_counter() - started, ok=ok)
+        return response
+
+    def remember_todos(self, html: str) -> None:
+        ids = [int(todo_id) for todo_id in DRAWER_LINK.findall(html)]
+        if ids:
+            self.todo_ids = ids
+
+    async def load_dashboard(self) -> None:
+        await self.request("dashboard", "GET", "/dashboard", htmx=False)
+        await self.request("dashboard_content", "GET", "/dashboard/partials/content")
+        response = await self.request("dashboard_data", "GET", "/dashboard/partials/data")
+        self.remember_todos(response.text)
+
+    async def paginate(self) -> None:
+        params = {"pageNumber": random.randint(0, 4)}
+        await self.request("dashboard_content", "GET", "/dashboard/partials/content", params=params)
+        response = await self.request("dashboard_data", "GET", "/dashboard/partials/data", params=params)
+        self.remember_todos(response.text)
+
+    async def search(self) -> None:
+        params = {"search": random.choice(SEARCH_TERMS)}
+        await self.request("dashboard_data", "GET", "/dashboard/partials/data", params=params)
+
+    async def open_drawer(self) -> int:
+        todo_id = random.choice(self.todo_ids)
+        await self.request("drawer_update", "GET", f"/dashboard/partials/drawer/{todo_id}")
+        return todo_id
+
+    async def save_form(self) -> None:
+        todo_id = await self.open_drawer()
+        # The first share row is the owner and is skipped by the app
+        shares = [self.email] + [f"friend-{i}@load.test" for i in random.sample(range(10), 3)]
+        await self.request("update_todo_from_form", "POST", f"/dashboard/todos/update/{todo_id}", data={
+            "title": f"Todo {todo_id} (edited)",
+            "description": "Saved by the load test",
+            "priority": random.randint(0, 4),
+            "deadline_date": "2099-01-01",
+            "deadline_time": "12:00",
+            "categories": ["load-test"],
+            "shares_email": shares,
+            "shares_access_level": [3] + [random.randint(0, 2) for _ in shares[1:]],
+        })
+
+    async def toggle(self) -> None:
+        todo_id = random.choice(self.todo_ids)
+        await self.request("todo_toggle", "PUT", f"/dashboard/todos/{todo_id}/toggle",
+                           data={"completed": random.choice(["true", "false"])})
+
+    async def create(self) -> None:
+        await self.request("create_todo_from_form", "POST", "/dashboard/todos/create", data={
+            "title": "Created by the load test",
+            "priority": 1,
+            "categories": ["load-test"],
+            "shares_email": [f"friend-{random.randint(0, 9)}@load.test"],
+            "shares_access_level": [1],
+        })
+
+    async def run(self, deadline: float) -> None:
+        flows = [self.load_dashboard, self.paginate, self.search, self.open_drawer, self.save_form,
+                 self.toggle, self.create]
+        weights = [2, 4, 2, 3, 1, 1, 0.5]
+        while time.perf_counter() < deadline:
+            try:
+                await random.choices(flows, weights)[0]()
+            except httpx.HTTPError:
+                pass
+            if self.think_time:
+                await asyncio.sleep(random.expovariate(1 / self.think_time))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+async def start_fake_upstream(port: int, todos_per_user: int, latency: float) -> uvicorn.Server:
+    app = create_fake_upstream(f"http://127.0.0.1:{port}", todos_per_user, latency)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           access_log=False, lifespan="off"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+def start_fake_valkey(port: int):
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        sys.exit("fakeredis is not installed, install it or start Valkey with "
+                 "`docker compose up valkey` and pass --valkey localhost:6379")
+    server = TcpFakeServer(("127.0.0.1", port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(workspace: Path, port: int, app_args: list[str], workers: int | None = None) -> subprocess.Popen:
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT / "src")}
+    if workers:
+        # The production entry point, uvloop and httptools with one process per worker
+        command = [sys.executable, "-m", "microfastapitodowebapp.server"]
+        env.update(serverWorkers=str(workers), serverHost="127.0.0.1", serverPort=str(port))
+    else:
+        command = [sys.executable, "-m", "uvicorn", "microfastapitodowebapp.main:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--no-access-log", "--log-level", "warning", *app_args]
+    log = open(workspace / "app.log", "wb")
+    return subprocess.Popen(command, cwd=workspace, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"App exited with code {process.returncode}")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("App did not become ready in time")
+
+
+def print_report(report: dict[str, dict[str, float]], baseline: dict | None) -> None:
+    header = f"{'route':<24}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    if baseline:
+        header += f"{'p95 vs base':>13}"
+    print(header)
+    print("-" * len(header))
+    for route, row in report.items():
+        line = (f"{route:<24}{row['requests']:>10}{row['errors']:>8}{row['throughput']:>9.1f}"
+                f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{row['max']:>9.1f}")
+        if baseline and route in baseline and baseline[route]["p95"]:
+            line += f"{(row['p95'] / baseline[route]['p95'] - 1) * 100:>+12.1f}%"
+        print(line)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    workspace = Path(tempfile.mkdtemp(prefix="todo-loadtest-"))
+    upstream_port, app_port = free_port(), free_port()
+    upstream = await start_fake_upstream(upstream_port, args.todos, args.upstream_latency / 1000)
+    fake_valkey = None
+    if args.valkey:
+        valkey_host, _, valkey_port = args.valkey.partition(":")
+        valkey_port = int(valkey_port or 6379)
+    else:
+        valkey_host, valkey_port = "127.0.0.1", free_port()
+        fake_valkey = start_fake_valkey(valkey_port)
+    write_workspace(workspace, f"http://127.0.0.1:{upstream_port}", valkey_host, valkey_port)
+    process = start_app(workspace, app_port, shlex.split(args.app_args), args.workers)
+    base_url = f"http://127.0.0.1:{app_port}"
+    recorder = Recorder()
+    users = [VirtualUser(base_url, recorder, args.think_time) for _ in range(args.users)]
+    try:
+        await wait_until_ready(base_url, process)
+        for i, user in enumerate(users):
+            user.email = f"user-{i + 1}@load.test"
+        await asyncio.gather(*(user.login() for user in users))
+        print(f"{args.users} users logged in, warming up for {args.warmup}s then measuring for {args.duration}s",
+              file=sys.stderr)
+        started = time.perf_counter()
+        asyncio.get_running_loop().call_later(args.warmup, recorder.start)
+        deadline = started + args.warmup + args.duration
+        await asyncio.gather(*(user.run(deadline) for user in users))
+        recorder.stop()
+        return recorder.report()
+    except Exception:
+        print(f"Load test failed, app log: {workspace / 'app.log'}", file=sys.stderr)
+        args.keep_workspace = True
+        raise
+    finally:
+        await asyncio.gather(*(user.close() for user in users))
+        process.terminate()
+        process.wait(timeout=10)
+        upstream.should_exit = True
+        if fake_valkey is not None:
+            fake_valkey.shutdown()
+        if not args.keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the web app against local Todo API, Keycloak and "
+                                                 "Valkey stand-ins")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds before measuring starts")
+    parser.add_argument("--think-time", type=float, default=0, help="mean pause between user actions in seconds")
+    parser.add_argument("--todos", type=int, default=200, help="todos per user in the fake Todo API")
+    parser.add_argument("--upstream-latency", type=float, default=5, help="added latency of the fake services in ms")
+    parser.add_argument("--valkey", help="host:port of a real Valkey, by default an in-process fakeredis server")
+    parser.add_argument("--app-args", default="", help="extra uvicorn arguments for the app")
+    parser.add_argument("--workers", type=int, help="run the app through microfastapitodowebapp.server with this "
+                                                    "many workers, --app-args is ignored then")
+    parser.add_argument("--output", type=Path, help="write the report as JSON, to be used as a later --baseline")
+    parser.add_argument("--baseline", type=Path, help="JSON report of an earlier run to compare p95 against")
+    parser.add_argument("--keep-workspace", action="store_true", help="keep the generated config and app log")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the user flows")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print_report(report, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
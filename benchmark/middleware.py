@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import ModuleType
+
+import httpx
+
+from loadtest import REPO_ROOT, write_workspace
+
+MIDDLEWARE_PATH = "src/microfastapitodowebapp/config/middleware.py"
+PUBLIC_URLS = ["/", "/favicon.ico", "/login**", "/static/**", "/metrics"]
+SESSION_ID = "benchmark"
+STATIC_PATH = "/static/js/htmx.min.js"
+AUTHENTICATED_PATH = "/dashboard/ping"
+
+
+def load_middleware(revision: str | None) -> ModuleType:
+    if revision is None:
+        return importlib.import_module("microfastapitodowebapp.config.middleware")
+    # An older config/middleware.py, imported against the current package
+    source = subprocess.run(["git", "show", f"{revision}:{MIDDLEWARE_PATH}"], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    path = Path(tempfile.mkdtemp(prefix="todo-middleware-")) / "middleware.py"
+    path.write_text(source)
+    spec = importlib.util.spec_from_file_location(f"middleware_{revision}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_app(middleware: ModuleType, store):
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+    from fastapi.staticfiles import StaticFiles
+    from starsessions import SessionMiddleware, SessionAutoloadMiddleware
+
+    app = FastAPI()
+    app.mount("/static", StaticFiles(directory=REPO_ROOT / "src/resources/static"), name="static")
+
+    @app.get(AUTHENTICATED_PATH)
+    async def ping():
+        return PlainTextResponse("ok")
+
+    @app.get("/login/oauth2/code/keycloak", name="auth_callback")
+    async def auth_callback():
+        return PlainTextResponse("callback")
+
+    # Same order as main.py, the session store is the same for every revision so only the middleware differs
+    if hasattr(middleware, "RequestCancellationMiddleware"):
+        app.add_middleware(middleware.RequestCancellationMiddleware)
+    app.add_middleware(middleware.RequestContextMiddleware)
+    app.add_middleware(middleware.AuthGuardMiddleware, callback_endpoint_name="auth_callback",
+                       public_urls=PUBLIC_URLS)
+    app.add_middleware(middleware.HTMXRedirectMiddleware)
+    app.add_middleware(SessionAutoloadMiddleware)
+    app.add_middleware(SessionMiddleware, store=store, lifetime=3600, rolling=True, cookie_https_only=False)
+    return app
+
+
+async def measure(app, path: str, requests: int, cookies: dict[str, str] | None = None) -> float:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark",
+                                 cookies=cookies) as client:
+        for _ in range(min(100, requests)):
+            response = await client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} answered {response.status_code}")
+        started = time.perf_counter()
+        for _ in range(requests):
+            await client.get(path)
+        return requests / (time.perf_counter() - started)
+
+
+async def run(args: argparse.Namespace) -> None:
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("fakeredis is not installed")
+    from starsessions.stores.redis import RedisStore
+
+    connection = fakeredis.FakeAsyncRedis()
+    store = RedisStore(connection=connection)
+    expires = time.time() + 86400
+    await connection.set(f"starsessions.{SESSION_ID}", json.dumps({"token": {
+        "access_token": "benchmark", "refresh_token": "benchmark", "token_type": "Bearer",
+        "expires_at": expires, "refresh_expires_at": expires, "userinfo": {"sub": "benchmark"},
+    }}))
+
+    print(f"{'middleware':<16}{'static req/s':>14}{'authenticated req/s':>22}")
+    for label, revision in [*((revision, revision) for revision in args.compare), ("working tree", None)]:
+        app = build_app(load_middleware(revision), store)
+        static = await measure(app, STATIC_PATH, args.requests)
+        authenticated = await measure(app, AUTHENTICATED_PATH, args.requests, {"session": SESSION_ID})
+        print(f"{label:<16}{static:>14.0f}{authenticated:>22.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="In-process throughput of the request middleware stack, "
+                                                 "sequential requests through httpx's ASGI transport")
+    parser.add_argument("--requests", type=int, default=3000, help="measured requests per path")
+    parser.add_argument("--compare", nargs="*", default=[], metavar="REVISION",
+                        help="git revisions whose config/middleware.py is measured as well, "
+                             "e.g. 86c7f2b~1 for the BaseHTTPMiddleware version")
+    args = parser.parse_args()
+
+    # The middleware reads its settings on import, from the same workspace layout the load test uses
+    workspace = Path(tempfile.mkdtemp(prefix="todo-middleware-"))
+    write_workspace(workspace, "http://127.0.0.1:9", "127.0.0.1", 6379)
+    os.chdir(workspace)
+    sys.path.insert(0, str(REPO_ROOT / "src"))
+    from loguru import logger
+    logger.remove()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
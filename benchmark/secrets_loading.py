@@ -0,0 +1,72 @@
+import argparse
+import base64
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from cryptography.fernet import Fernet
+
+from loadtest import REPO_ROOT, write_workspace
+
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+
+class FakeSecretsClient:
+    # Stands in for oci.secrets.SecretsClient, every call costs one vault round trip
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def get_secret_bundle_by_name(self, secret_name: str, vault_id: str):
+        time.sleep(self.latency)
+        content = base64.b64encode(f"{secret_name}-value".encode("ascii")).decode("ascii")
+        return SimpleNamespace(data=SimpleNamespace(secret_bundle_content=SimpleNamespace(content=content)))
+
+
+def timed(func) -> tuple[float, dict]:
+    started = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time vault secret loading against a fake secrets client")
+    parser.add_argument("--latency", type=float, default=150, help="vault round trip in ms")
+    args = parser.parse_args()
+
+    workspace = Path(tempfile.mkdtemp(prefix="todo-secrets-"))
+    write_workspace(workspace, "http://127.0.0.1:1", "127.0.0.1", 6379)
+    with open(workspace / "local-config" / "service.properties", "a") as properties:
+        properties.write(f"secretCacheFile={workspace / 'secrets.cache'}\nsecretCacheTtlSeconds=300\n")
+    (workspace / "local-config" / "vault.properties").write_text("vaultOcid=ocid1.vault.fake\n")
+    os.environ["SECRET_CACHE_KEY"] = Fernet.generate_key().decode("ascii")
+    os.chdir(workspace)
+
+    try:
+        run(args.latency / 1000)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def run(latency: float) -> None:
+    from microfastapitodowebapp.config import configuration
+
+    names = [configuration.service_config.get(key) for key in configuration.SECRET_NAME_KEYS]
+    vault_config = configuration.Config(f"{configuration.config_directory}/vault.properties")
+    client = FakeSecretsClient(latency)
+
+    sequential, _ = timed(lambda: {name: configuration.fetch_secret(name, client, vault_config) for name in names})
+    concurrent, fetched = timed(lambda: configuration.load_vault_secrets(names, lambda: client))
+    cached, loaded = timed(lambda: configuration.load_vault_secrets(names, lambda: client))
+    assert fetched == loaded, "cached secrets differ from the fetched ones"
+
+    print(f"sequential fetch   {sequential:8.1f} ms")
+    print(f"concurrent fetch   {concurrent:8.1f} ms")
+    print(f"cached (restart)   {cached:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from loadtest import REPO_ROOT, free_port, start_fake_valkey, write_workspace
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def app_env() -> dict[str, str]:
+    return {**os.environ, "PYTHONPATH": str(REPO_ROOT / "src")}
+
+
+def measure_imports(workspace: Path) -> tuple[float, list[tuple[str, float]]]:
+    # -X importtime reports microseconds per module, indented by import depth
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import microfastapitodowebapp.main"],
+                            cwd=workspace, env=app_env(), capture_output=True, text=True, check=True)
+    total = 0.0
+    children = []
+    for match in IMPORT_TIME_LINE.finditer(result.stderr):
+        cumulative, depth, name = int(match.group(2)) / 1000, len(match.group(3)) // 2, match.group(4)
+        if name == "microfastapitodowebapp.main":
+            total = cumulative
+        elif depth == 1:
+            children.append((name, cumulative))
+    return total, children
+
+
+def measure_first_request(workspace: Path, timeout: float = 30) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "microfastapitodowebapp.main:app", "--host",
+                                "127.0.0.1", "--port", str(port), "--no-access-log", "--log-level", "warning"],
+                               cwd=workspace, env=app_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"App exited with code {process.returncode}")
+                try:
+                    if client.get("/").status_code == 200:
+                        return (time.perf_counter() - started) * 1000
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+        raise RuntimeError("App did not serve a request in time")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure import time and time to first request of the app")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12, help="direct imports of main to list")
+    parser.add_argument("--max-import-ms", type=float, help="fail when the median import time is higher")
+    parser.add_argument("--max-ready-ms", type=float, help="fail when the median time to first request is higher")
+    args = parser.parse_args()
+
+    workspace = Path(tempfile.mkdtemp(prefix="todo-startup-"))
+    valkey_port = free_port()
+    valkey = start_fake_valkey(valkey_port)
+    write_workspace(workspace, "http://127.0.0.1:1", "127.0.0.1", valkey_port)
+    try:
+        imports = [measure_imports(workspace) for _ in range(args.runs)]
+        ready = [measure_first_request(workspace) for _ in range(args.runs)]
+    finally:
+        valkey.shutdown()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    import_ms = statistics.median(total for total, _ in imports)
+    ready_ms = statistics.median(ready)
+    print(f"import microfastapitodowebapp.main  {import_ms:8.1f} ms (median of {args.runs})")
+    print(f"process start to first response     {ready_ms:8.1f} ms (median of {args.runs})")
+    print("\nslowest direct imports of main (cumulative ms, last run)")
+    for name, cumulative in sorted(imports[-1][1], key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {cumulative:8.1f}  {name}")
+
+    failed = False
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"\nimport time {import_ms:.1f} ms is above the {args.max_import_ms:.1f} ms limit", file=sys.stderr)
+        failed = True
+    if args.max_ready_ms is not None and ready_ms > args.max_ready_ms:
+        print(f"\ntime to first response {ready_ms:.1f} ms is above the {args.max_ready_ms:.1f} ms limit",
+              file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from decode import build_page
+from loadtest import REPO_ROOT, write_workspace
+
+TEMPLATE = "partials/_todo_list.html"
+PATH = "/dashboard/partials/todos"
+
+
+def create_request(app):
+    from fastapi.requests import Request
+
+    return Request({"type": "http", "app": app, "router": app.router, "method": "GET", "path": PATH,
+                    "raw_path": PATH.encode(), "query_string": b"", "headers": [(b"host", b"benchmark")],
+                    "scheme": "http", "server": ("benchmark", 80), "client": ("127.0.0.1", 1), "root_path": "",
+                    "http_version": "1.1"})
+
+
+async def send_response(request, build_response) -> tuple[float, float]:
+    # Time to the first body chunk and to the end of the response, rendering included
+    first_body = None
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal first_body
+        if message["type"] == "http.response.body" and message.get("body") and first_body is None:
+            first_body = time.perf_counter()
+
+    started = time.perf_counter()
+    await build_response()(request.scope, receive, send)
+    return first_body - started, time.perf_counter() - started
+
+
+async def measure(request, build_response, repetitions: int) -> tuple[float, float, float]:
+    timings = [await send_response(request, build_response) for _ in range(repetitions)]
+    peaks = []
+    # A separate pass, tracing allocations slows rendering down too much for the timings
+    for _ in range(max(1, repetitions // 5)):
+        tracemalloc.start()
+        await send_response(request, build_response)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return (statistics.median(ttfb for ttfb, _ in timings) * 1000,
+            statistics.median(total for _, total in timings) * 1000,
+            statistics.median(peaks) / 1024)
+
+
+async def run(args: argparse.Namespace) -> None:
+    from microfastapitodowebapp.config.jinja import templates, streaming_template_response
+    from microfastapitodowebapp.main import app
+    from microfastapitodowebapp.model.todo_response import TodoResponse
+
+    request = create_request(app)
+    print(f"{'pageSize':>8}  {'buffered TTFB/total ms':>23}{'peak KiB':>10}  {'streaming TTFB/total ms':>24}"
+          f"{'peak KiB':>10}")
+    for size in args.sizes:
+        todo_response = TodoResponse.from_json(build_page(size))
+        context = {"todos": todo_response.content, "page": todo_response.page}
+        buffered = await measure(request, lambda: templates.TemplateResponse(
+            request=request, name=TEMPLATE, context=dict(context)), args.repetitions)
+        streaming = await measure(request, lambda: streaming_template_response(
+            request=request, name=TEMPLATE, context=dict(context)), args.repetitions)
+        print(f"{size:>8}  {buffered[0]:>11.1f}/{buffered[1]:<11.1f}{buffered[2]:>10.0f}"
+              f"  {streaming[0]:>12.1f}/{streaming[1]:<11.1f}{streaming[2]:>10.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time to first byte, total time and peak memory of the todo list "
+                                                 "partial, rendered buffered and streamed")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 200, 500])
+    parser.add_argument("--repetitions", type=int, default=20, help="timed renders per size and mode")
+    parser.add_argument("--no-card-cache", action="store_true", help="render every todo card from the template")
+    args = parser.parse_args()
+
+    workspace = Path(tempfile.mkdtemp(prefix="todo-streaming-"))
+    write_workspace(workspace, "http://127.0.0.1:9", "127.0.0.1", 6379)
+    os.chdir(workspace)
+    sys.path.insert(0, str(REPO_ROOT / "src"))
+    if args.no_card_cache:
+        os.environ["todoCardCacheMaxBytes"] = "0"
+    from loguru import logger
+    logger.remove()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from microfastapitodowebapp.config.configuration import service_config
+from microfastapitodowebapp.config.static_assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    # Standard library from Python 3.14
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+MINIMUM_SIZE: int = service_config.get("compressionMinimumSize", cast=int, default=512)
+GZIP_LEVEL: int = service_config.get("compressionGzipLevel", cast=int, default=6)
+BROTLI_LEVEL: int = service_config.get("compressionBrotliLevel", cast=int, default=4)
+ZSTD_LEVEL: int = service_config.get("compressionZstdLevel", cast=int, default=3)
+COMPRESSIBLE_TYPES: tuple[str, ...] = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+
+class GzipEncoder:
+    def __init__(self):
+        # wbits 31 writes the gzip header and trailer
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flush, so every streamed chunk reaches the browser without waiting for the next one
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_LEVEL)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self):
+        self.compressor = zstd.ZstdCompressor(level=ZSTD_LEVEL)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data, mode=zstd.ZstdCompressor.FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self.compressor.compress(data, mode=zstd.ZstdCompressor.FLUSH_FRAME)
+
+
+# In order of preference, encodings whose library is missing are never offered
+ENCODERS: dict[str, type] = {
+    encoding: encoder for encoding, encoder, available in (
+        ("zstd", ZstdEncoder, zstd is not None),
+        ("br", BrotliEncoder, brotli is not None),
+        ("gzip", GzipEncoder, True),
+    ) if available
+}
+
+
+def select_encoding(accept_encoding: str | None) -> str | None:
+    accepted = accepted_encodings(accept_encoding)
+    return next((encoding for encoding in ENCODERS if encoding in accepted), None)
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+        return False
+    return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+
+def update_headers(headers: MutableHeaders, encoding: str) -> None:
+    headers["Content-Encoding"] = encoding
+    headers.add_vary_header("Accept-Encoding")
+    # The compressed bytes differ from the identity ones, If-None-Match still matches a weak ETag
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, excluded_prefixes: tuple[str, ...] = ()):
+        self.app = app
+        self.excluded_prefixes = excluded_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith(self.excluded_prefixes):
+            await self.app(scope, receive, send)
+            return
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        encoder = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk tells whether compressing pays off
+                start_message = message
+                if not is_compressible(Headers(raw=message["headers"])):
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if not more_body:
+                    if len(body) < MINIMUM_SIZE:
+                        passthrough = True
+                        await send(start_message)
+                        await send(message)
+                        return
+                    compressed = ENCODERS[encoding]().finish(body)
+                    update_headers(headers, encoding)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                # Streaming responses are compressed chunk by chunk, the total length is unknown upfront
+                encoder = ENCODERS[encoding]()
+                update_headers(headers, encoding)
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                await send(start_message)
+            if more_body:
+                await send({"type": "http.response.body", "body": encoder.compress(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": encoder.finish(body)})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,9 +1,16 @@
 import base64
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TYPE_CHECKING
 
-import oci
+from cryptography.fernet import Fernet, InvalidToken
 from loguru import logger
 from starlette.config import Config
 
+if TYPE_CHECKING:
+    import oci
+
 secrets: dict[str, str] = {}
 
 env_config = Config(".env")
@@ -20,8 +27,12 @@ def is_local_secret_provider():
 config_directory = env_config.get("CONFIG_DIRECTORY")
 service_config = Config(f"{config_directory}/service.properties")
 
+SECRET_NAME_KEYS = ("valkeyUsernameSecretName", "valkeyPasswordSecretName", "applicationClientSecretName")
+SECRET_CACHE_FILE: str | None = service_config.get("secretCacheFile", default=None)
+SECRET_CACHE_TTL: int = service_config.get("secretCacheTtlSeconds", cast=int, default=0)
+
 
-def fetch_secret(secret_name: str, secrets_client: oci.secrets.SecretsClient, vault_config: Config) -> str:
+def fetch_secret(secret_name: str, secrets_client: "oci.secrets.SecretsClient", vault_config: Config) -> str:
     secret_bundle = secrets_client.get_secret_bundle_by_name(secret_name, vault_config.get("vaultOcid"))
     base64_secret_content = secret_bundle.data.secret_bundle_content.content
     base64_secret_bytes = base64_secret_content.encode('ascii')
@@ -31,6 +42,80 @@ def fetch_secret(secret_name: str, secrets_client: oci.secrets.SecretsClient, va
     return secret_content
 
 
+def fetch_secrets(secret_names: list[str],
+                  create_secrets_client: Callable[[], "oci.secrets.SecretsClient"],
+                  vault_config: Config) -> dict[str, str]:
+    # One client per fetch, OCI clients are not safe to share between threads
+    def fetch(secret_name: str) -> str:
+        return fetch_secret(secret_name, create_secrets_client(), vault_config)
+
+    with ThreadPoolExecutor(max_workers=len(secret_names)) as executor:
+        return dict(zip(secret_names, executor.map(fetch, secret_names)))
+
+
+def get_secret_cache() -> Fernet | None:
+    if not SECRET_CACHE_FILE or SECRET_CACHE_TTL <= 0:
+        return None
+    key = env_config.get("SECRET_CACHE_KEY", default=None)
+    if not key:
+        logger.warning("secretCacheFile is set but SECRET_CACHE_KEY is missing, secrets are not cached")
+        return None
+    return Fernet(key)
+
+
+def load_cached_secrets(cache: Fernet, secret_names: list[str]) -> dict[str, str] | None:
+    try:
+        with open(SECRET_CACHE_FILE, "rb") as file:
+            cached = json.loads(cache.decrypt(file.read(), ttl=SECRET_CACHE_TTL))
+    except FileNotFoundError:
+        return None
+    except (InvalidToken, ValueError):
+        logger.debug("Secret cache is expired or unreadable")
+        return None
+    if not all(name in cached for name in secret_names):
+        return None
+    return cached
+
+
+def store_cached_secrets(cache: Fernet, values: dict[str, str]) -> None:
+    temporary_file = f"{SECRET_CACHE_FILE}.{os.getpid()}"
+    try:
+        file_descriptor = os.open(temporary_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(cache.encrypt(json.dumps(values).encode("utf-8")))
+        os.replace(temporary_file, SECRET_CACHE_FILE)
+    except OSError as e:
+        logger.warning("Failed to write secret cache: {}", e)
+
+
+def create_instance_principal_client_factory() -> Callable[[], "oci.secrets.SecretsClient"]:
+    # The OCI SDK takes a quarter of a second to import and is only needed on this path
+    import oci
+
+    # Fetches its security token once, shared by every client
+    signer = oci.auth.signers.InstancePrincipalsSecurityTokenSigner()
+    return lambda: oci.secrets.SecretsClient(config={}, signer=signer)
+
+
+def load_vault_secrets(secret_names: list[str],
+                       create_secrets_client: Callable[[], "oci.secrets.SecretsClient"] | None = None) -> dict[str, str]:
+    cache = get_secret_cache()
+    if cache is not None:
+        cached = load_cached_secrets(cache, secret_names)
+        if cached is not None:
+            logger.debug("Loaded secrets from cache")
+            return cached
+    vault_config = Config(f"{config_directory}/vault.properties")
+    values = fetch_secrets(
+        secret_names,
+        create_secrets_client or create_instance_principal_client_factory(),
+        vault_config
+    )
+    if cache is not None:
+        store_cached_secrets(cache, values)
+    return values
+
+
 def load_secrets():
     if is_local_secret_provider():
         logger.debug("Loading secrets from local config")
@@ -43,26 +128,4 @@ def load_secrets():
         secrets[service_config.get("applicationClientSecretName")] = oauth_config.get("clientSecret")
     else:
         logger.debug("Loading secrets from vault")
-        vault_config = Config(f"{config_directory}/vault.properties")
-        signer = oci.auth.signers.InstancePrincipalsSecurityTokenSigner()
-        secrets_client = oci.secrets.SecretsClient(config={}, signer=signer)
-        # Valkey
-        secrets[service_config.get("valkeyUsernameSecretName")] = fetch_secret(
-            service_config.get("valkeyUsernameSecretName"),
-            secrets_client,
-            vault_config
-        )
-        secrets[service_config.get("valkeyPasswordSecretName")] = fetch_secret(
-            service_config.get("valkeyPasswordSecretName"),
-            secrets_client,
-            vault_config
-        )
-        # OAuth
-        secrets[service_config.get("applicationClientSecretName")] = fetch_secret(
-            service_config.get("applicationClientSecretName"),
-            secrets_client,
-            vault_config
-        )
-
-
-load_secrets()
+        secrets.update(load_vault_secrets([service_config.get(key) for key in SECRET_NAME_KEYS]))
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from typing import Hashable
+
+from jinja2 import Template
+from markupsafe import Markup
+
+from microfastapitodowebapp.config.metrics import fragment_cache_events, fragment_cache_size, fragment_cache_entries
+
+
+class FragmentCache:
+    # LRU of rendered HTML, bounded by the total length of the cached fragments
+    def __init__(self, name: str, max_size: int):
+        self.name = name
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict[Hashable, Markup] = OrderedDict()
+        self.template: Template | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def use_template(self, template: Template) -> None:
+        # A reloaded template renders differently, everything cached from the old one is stale
+        if template is not self.template:
+            self.clear()
+            self.template = template
+
+    def get(self, key: Hashable) -> Markup | None:
+        html = self.entries.get(key)
+        if html is None:
+            fragment_cache_events.labels(cache=self.name, event="miss").inc()
+            return None
+        self.entries.move_to_end(key)
+        fragment_cache_events.labels(cache=self.name, event="hit").inc()
+        return html
+
+    def put(self, key: Hashable, html: Markup) -> None:
+        if len(html) > self.max_size:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.entries[key] = html
+        self.size += len(html)
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            fragment_cache_events.labels(cache=self.name, event="eviction").inc()
+        self.record_size()
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+        self.record_size()
+
+    def record_size(self) -> None:
+        fragment_cache_size.labels(cache=self.name).set(self.size)
+        fragment_cache_entries.labels(cache=self.name).set(len(self.entries))
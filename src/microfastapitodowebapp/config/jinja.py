@@ -1,3 +1,150 @@
+import hashlib
+import os
+import sys
+import time
+from typing import Any, AsyncIterator, Iterator, Mapping
+
+from fastapi.requests import Request
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
 from jinja2_fragments.fastapi import Jinja2Blocks
+from loguru import logger
+from markupsafe import Markup
+from starlette.responses import StreamingResponse
+
+from microfastapitodowebapp.config.configuration import service_config, is_local_config
+from microfastapitodowebapp.config.fragment_cache import FragmentCache
+from microfastapitodowebapp.config.metrics import template_render_duration
+from microfastapitodowebapp.config.static_assets import static_url
+
+TEMPLATE_DIRECTORY: str = "src/resources/templates"
+BYTECODE_CACHE_DIRECTORY: str | None = service_config.get("templateBytecodeCacheDirectory", default=None)
+# Checking every template's modification time on each render only pays off while editing them
+AUTO_RELOAD: bool = str(service_config.get("templateAutoReload", default=is_local_config())).lower() == "true"
+MACROS_TEMPLATE: str = "components/_macros.html"
+
+
+class TimedJinja2Blocks(Jinja2Blocks):
+    def TemplateResponse(self, *args, **kwargs):
+        # Templates are rendered eagerly when the response is built
+        name = kwargs["name"] if "name" in kwargs else args[1]
+        with template_render_duration.labels(template=name).time():
+            return super().TemplateResponse(*args, **kwargs)
+
+
+def create_environment() -> Environment:
+    bytecode_cache = None
+    if BYTECODE_CACHE_DIRECTORY:
+        os.makedirs(BYTECODE_CACHE_DIRECTORY, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(BYTECODE_CACHE_DIRECTORY)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIRECTORY),
+        autoescape=select_autoescape(),
+        auto_reload=AUTO_RELOAD,
+        bytecode_cache=bytecode_cache,
+    )
+
+
+templates = TimedJinja2Blocks(env=create_environment())
+
+todo_card_cache = FragmentCache("todo_card", service_config.get("todoCardCacheMaxBytes", cast=int,
+                                                                 default=8 * 1024 * 1024))
+
+
+def cached_todo_card(request: Request, todo) -> Markup:
+    macros = templates.env.get_template(MACROS_TEMPLATE)
+    if not todo_card_cache.enabled:
+        return macros.module.todo_card(request, todo)
+    todo_card_cache.use_template(macros)
+    # The base URL covers the links built with url_for
+    key = (todo.version, str(request.base_url))
+    html = todo_card_cache.get(key)
+    if html is None:
+        html = macros.module.todo_card(request, todo)
+        todo_card_cache.put(key, html)
+    return html
+
+
+templates.env.globals["cached_todo_card"] = cached_todo_card
+templates.env.globals["static_url"] = static_url
+
+_template_version: str | None = None
+
+
+def template_version() -> str:
+    # Hash of every template source, recomputed per call only while templates can change
+    global _template_version
+    if _template_version is None or AUTO_RELOAD:
+        digest = hashlib.blake2b(digest_size=8)
+        for name in templates.env.list_templates(extensions=["html"]):
+            digest.update(templates.env.loader.get_source(templates.env, name)[0].encode("utf-8"))
+        _template_version = digest.hexdigest()
+    return _template_version
+
+
+def precompile_templates() -> int:
+    # Loads every template once, filling the in-memory cache and the bytecode cache when configured
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
+
+STREAM_FLUSH_SIZE: int = 2048
+
+
+def _generate(template: Template, context: dict[str, Any], block_names: list[str]) -> Iterator[str]:
+    if not block_names:
+        yield from template.generate(context)
+        return
+    template_context = template.new_context(context)
+    for block_name in block_names:
+        yield from template.blocks[block_name](template_context)
+
+
+async def _buffered(chunks: Iterator[str], flush_size: int, name: str) -> AsyncIterator[str]:
+    # A macro call such as todo_card is emitted as a single chunk, so a card fills the buffer on its own
+    buffer: list[str] = []
+    size = 0
+    rendering = 0.0
+    started = time.perf_counter()
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= flush_size:
+            rendering += time.perf_counter() - started
+            yield "".join(buffer)
+            started = time.perf_counter()
+            buffer.clear()
+            size = 0
+    rendering += time.perf_counter() - started
+    # Only render time is recorded, time spent waiting on the client between flushes is excluded
+    template_render_duration.labels(template=name).observe(rendering)
+    if buffer:
+        yield "".join(buffer)
+
+
+def streaming_template_response(request: Request,
+                                name: str,
+                                context: dict[str, Any] | None = None,
+                                status_code: int = 200,
+                                headers: Mapping[str, str] | None = None,
+                                *,
+                                block_names: list[str] | None = None,
+                                flush_size: int = STREAM_FLUSH_SIZE) -> StreamingResponse:
+    context = context or {}
+    context.setdefault("request", request)
+    for context_processor in templates.context_processors:
+        context.update(context_processor(request))
+    template = templates.get_template(name)
+    return StreamingResponse(
+        _buffered(_generate(template, context, block_names or []), flush_size, name),
+        status_code=status_code,
+        headers=headers,
+        media_type="text/html",
+    )
+
 
-templates = Jinja2Blocks(directory="src/resources/templates")
\ No newline at end of file
+if __name__ == "__main__":
+    # Build step, fills the bytecode cache so workers never compile templates from source
+    if not BYTECODE_CACHE_DIRECTORY:
+        sys.exit("templateBytecodeCacheDirectory is not configured")
+    logger.info("Precompiled {} templates into {}", precompile_templates(), BYTECODE_CACHE_DIRECTORY)
@@ -0,0 +1,126 @@
+import contextvars
+import os
+import time
+from functools import wraps
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+upstream_operation = contextvars.ContextVar("upstream_operation", default="other")
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency per route", ("route", "method", "status"),
+    buckets=DEFAULT_BUCKETS
+)
+upstream_duration = Histogram(
+    "upstream_request_duration_seconds", "Upstream request latency per service function", ("operation", "host"),
+    buckets=DEFAULT_BUCKETS
+)
+upstream_responses = Counter(
+    "upstream_responses", "Upstream responses per service function and status", ("operation", "host", "status")
+)
+upstream_pool_wait = Histogram(
+    "upstream_pool_wait_seconds", "Time spent waiting for a pooled upstream connection", ("host",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+session_store_duration = Histogram(
+    "session_store_duration_seconds", "Valkey session store latency", ("operation",), buckets=DEFAULT_BUCKETS
+)
+template_render_duration = Histogram(
+    "template_render_duration_seconds", "Template render time", ("template",), buckets=DEFAULT_BUCKETS
+)
+fragment_cache_events = Counter(
+    "fragment_cache_events", "Rendered fragment cache hits, misses and evictions", ("cache", "event")
+)
+# Summed over the live workers, every worker holds its own fragment caches
+fragment_cache_size = Gauge(
+    "fragment_cache_size_bytes", "Total length of the cached fragments", ("cache",), multiprocess_mode="livesum"
+)
+fragment_cache_entries = Gauge(
+    "fragment_cache_entries", "Cached fragments", ("cache",), multiprocess_mode="livesum"
+)
+todo_cache_hits = Counter("todo_cache_hits", "Todo cache hits")
+todo_cache_misses = Counter("todo_cache_misses", "Todo cache misses")
+todo_cache_invalidations = Counter("todo_cache_invalidations", "Todo cache invalidations")
+todo_cache_errors = Counter("todo_cache_errors", "Todo cache Valkey errors")
+todo_cache_prefetch_hits = Counter("todo_cache_prefetch_hits", "Todo cache hits served from a prefetched page")
+todo_cache_prefetch_stores = Counter("todo_cache_prefetch_stores", "Pages stored by background prefetches")
+request_cancellations = Counter(
+    "request_cancellations", "Requests cancelled before they finished", ("reason",)
+)
+
+
+def upstream_call(operation: str):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = upstream_operation.set(operation)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                upstream_operation.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def is_multiprocess() -> bool:
+    # Set by the production entry point, every worker writes its samples to files in that directory
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def render_metrics() -> bytes:
+    if not is_multiprocess():
+        return generate_latest(REGISTRY)
+    # A scrape reaches one worker, it merges the files of all of them
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead(pid: int) -> None:
+    # Drops the live gauges of an exiting worker, its counters and histograms stay in the totals
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid)
+
+
+def route_name(scope: Scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.name
+    # Mounts do not set a route, the router leaves the mounted app as the endpoint
+    endpoint = scope.get("endpoint")
+    for mount in getattr(scope.get("app"), "routes", ()):
+        if isinstance(mount, Mount) and mount.app is endpoint and mount.name:
+            return mount.name
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_duration.labels(route=route_name(scope), method=scope["method"],
+                                    status=str(status_code)).observe(time.perf_counter() - started)
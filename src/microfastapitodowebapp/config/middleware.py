@@ -1,45 +1,61 @@
+import asyncio
 import fnmatch
+import re
+from dataclasses import dataclass
 from datetime import datetime, timezone
 
 from fastapi.requests import Request
 from loguru import logger
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
-from starlette.types import ASGIApp
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from microfastapitodowebapp.config.context import request_context
 from microfastapitodowebapp.config.oauth import oauth
 from microfastapitodowebapp.config.configuration import service_config
+from microfastapitodowebapp.config.metrics import request_cancellations
 
 TOKEN = "token"
 AUTH_SERVER_HOST = service_config.get("authorizationServerHost")
+REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+# nginx's status for requests the client closed, only ever seen in metrics and logs
+CLIENT_CLOSED_REQUEST = 499
 
-class RequestContextMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        token = request_context.set(request)
+
+def compile_public_urls(public_urls: list[str]) -> re.Pattern:
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in public_urls) or r"(?!)")
+
+
+class RequestContextMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = request_context.set(Request(scope, receive))
         try:
-            response = await call_next(request)
-            return response
+            await self.app(scope, receive, send)
         finally:
             request_context.reset(token)
 
 
-class AuthGuardMiddleware(BaseHTTPMiddleware):
+class AuthGuardMiddleware:
     def __init__(self, app: ASGIApp, callback_endpoint_name: str, public_urls: list[str]):
-        super().__init__(app)
+        self.app = app
         self.callback_name = callback_endpoint_name
         self.public_urls = public_urls
+        self.public_url_matcher = compile_public_urls(public_urls)
 
     def should_skip(self, path: str) -> bool:
-        for pattern in self.public_urls:
-            if fnmatch.fnmatch(path, pattern):
-                return True
-        return False
-
-    async def dispatch(self, request: Request, call_next):
-        if self.should_skip(request.url.path):
-            logger.trace("Skipping auth check for {}", request.url.path)
-            return await call_next(request)
+        return self.public_url_matcher.match(path) is not None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.should_skip(scope["path"]):
+            logger.trace("Skipping auth check for {}", scope.get("path"))
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope, receive)
         session_id = request.cookies.get("session")
         if session_id:
             logger.trace("Session found {}", session_id)
@@ -49,7 +65,8 @@ class AuthGuardMiddleware(BaseHTTPMiddleware):
                 now = datetime.now(timezone.utc).timestamp()
                 refresh_expires_at = access_token["refresh_expires_at"]
                 if refresh_expires_at > now:
-                    return await call_next(request)
+                    await self.app(scope, receive, send)
+                    return
         logger.trace("User is not authenticated, redirecting to login page")
         if request.headers.get("HX-Request") and request.headers.get("HX-Current-URL"):
             redirect_url = request.headers.get("HX-Current-URL")
@@ -59,20 +76,130 @@ class AuthGuardMiddleware(BaseHTTPMiddleware):
             redirect_url += "?" + request.url.query
         request.session["redirect_url"] = redirect_url
         redirect_uri = request.url_for('auth_callback')
-        return await oauth.keycloak.authorize_redirect(request, redirect_uri)
-
-
-class HTMXRedirectMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        if request.headers.get("HX-Request"):
-            if response.status_code in (301, 302, 303, 307, 308):
-                location = response.headers.get("location")
-                if AUTH_SERVER_HOST in location:
-                    new_response = Response(status_code=200)
-                    new_response.headers["HX-Redirect"] = location
-                    cookie_val = response.headers.get("set-cookie")
+        response = await oauth.keycloak.authorize_redirect(request, redirect_uri)
+        await response(scope, receive, send)
+
+
+class HTMXRedirectMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not Headers(scope=scope).get("HX-Request"):
+            await self.app(scope, receive, send)
+            return
+
+        redirected = False
+
+        async def send_wrapper(message: Message):
+            nonlocal redirected
+            if message["type"] == "http.response.start" and message["status"] in REDIRECT_STATUS_CODES:
+                headers = Headers(raw=message["headers"])
+                location = headers.get("location")
+                if location and AUTH_SERVER_HOST in location:
+                    redirected = True
+                    new_headers = [(b"content-length", b"0"), (b"hx-redirect", location.encode("latin-1"))]
+                    cookie_val = headers.get("set-cookie")
                     if cookie_val:
-                        new_response.headers["set-cookie"] = cookie_val
-                    return new_response
-        return response
\ No newline at end of file
+                        new_headers.append((b"set-cookie", cookie_val.encode("latin-1")))
+                    await send({"type": "http.response.start", "status": 200, "headers": new_headers})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+            if redirected:
+                # The original redirect body is replaced by the empty HX-Redirect response
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+@dataclass
+class RunningRequest:
+    task: asyncio.Task
+    started: bool = False
+    completed: bool = False
+    superseded: bool = False
+    disconnected: bool = False
+
+
+class RequestCancellationMiddleware:
+    # Only reads are cancelled, a write the client gave up on still has to finish or fail on its own
+    def __init__(self, app: ASGIApp, supersedable_triggers: tuple[str, ...] = (),
+                 cancellable_prefixes: tuple[str, ...] = ()):
+        self.app = app
+        self.supersedable_triggers = supersedable_triggers
+        # Paths of the reads that wait on the upstream, anything else is not worth the extra tasks
+        self.cancellable_prefixes = cancellable_prefixes
+        self.latest: dict[tuple[str, ...], RunningRequest] = {}
+
+    def supersede_key(self, scope: Scope) -> tuple[str, ...] | None:
+        # HTMX swaps only the last response into its target, older ones are wasted. Limited to the listed triggers,
+        # two tabs of one session load the same partials and must not cancel each other.
+        headers = Headers(scope=scope)
+        trigger = headers.get("HX-Trigger-Name") or headers.get("HX-Trigger")
+        target = headers.get("HX-Target")
+        session_id = Request(scope).cookies.get("session")
+        if trigger not in self.supersedable_triggers or not target or not session_id:
+            return None
+        return session_id, trigger, target, headers.get("HX-Current-URL", "")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (scope["type"] != "http" or scope["method"] not in ("GET", "HEAD")
+                or not scope["path"].startswith(self.cancellable_prefixes)):
+            await self.app(scope, receive, send)
+            return
+
+        messages: asyncio.Queue[Message] = asyncio.Queue()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                running.started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                running.completed = True
+            await send(message)
+
+        running = RunningRequest(asyncio.create_task(self.app(scope, messages.get, send_wrapper)))
+
+        async def watch_disconnect():
+            # The app reads the forwarded messages, so it still sees the request and the disconnect itself
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    # Servers report a disconnect as soon as the response is complete, background tasks keep running
+                    if not running.completed and not running.task.done():
+                        running.disconnected = True
+                        running.task.cancel()
+                    return
+
+        watcher = asyncio.create_task(watch_disconnect())
+        key = self.supersede_key(scope)
+        if key is not None:
+            previous = self.latest.get(key)
+            # A response that already started streaming is left to finish, cutting it would swap in broken HTML
+            if previous is not None and not previous.started and not previous.task.done():
+                previous.superseded = True
+                previous.task.cancel()
+            self.latest[key] = running
+
+        try:
+            await asyncio.shield(running.task)
+            return
+        except asyncio.CancelledError:
+            if not running.task.cancelled():
+                # The server itself is cancelling this request
+                running.task.cancel()
+                raise
+        finally:
+            watcher.cancel()
+            if key is not None and self.latest.get(key) is running:
+                del self.latest[key]
+
+        reason = "disconnect" if running.disconnected else "superseded" if running.superseded else "cancelled"
+        request_cancellations.labels(reason=reason).inc()
+        logger.debug("Cancelled {} {} ({})", scope["method"], scope["path"], reason)
+        if not running.started:
+            # A superseded request gets a 204, which HTMX does not swap
+            status = CLIENT_CLOSED_REQUEST if running.disconnected else 204
+            await send({"type": "http.response.start", "status": status, "headers": [(b"content-length", b"0")]})
+            await send({"type": "http.response.body", "body": b""})
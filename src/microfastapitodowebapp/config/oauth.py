@@ -1,16 +1,127 @@
+import asyncio
+import json
 import time
 
 from authlib.integrations.starlette_client import OAuth
 from loguru import logger
+from redis.exceptions import RedisError
 from starlette.requests import Request
+from starsessions import get_session_id
 
 from microfastapitodowebapp.config.configuration import service_config, secrets, is_local_config
 from microfastapitodowebapp.config.context import request_context
+from microfastapitodowebapp.config.metrics import upstream_call
+from microfastapitodowebapp.config.upstream import get_upstream_transport, upstream_timeout
+from microfastapitodowebapp.config.valkey import get_valkey_client
+
+REFRESH_KEY_PREFIX: str = "token-refresh:"
+REFRESH_LEEWAY: int = service_config.get("tokenRefreshLeewaySeconds", cast=int, default=75)
+BACKGROUND_REFRESH_WINDOW: int = service_config.get("tokenBackgroundRefreshSeconds", cast=int, default=120)
+REFRESH_LOCK_TIMEOUT: int = 10
+REFRESH_POLL_INTERVAL: float = 0.05
+
+background_refreshes: set[asyncio.Task] = set()
+
+
+def merge_refreshed_token(current_token: dict, new_token: dict) -> dict:
+    token = dict(new_token)
+    token["userinfo"] = current_token["userinfo"]
+    token.setdefault("refresh_token", current_token["refresh_token"])
+    token["refresh_expires_at"] = int(time.time()) + token.get("refresh_expires_in", token["expires_in"])
+    return token
+
+
+async def load_shared_token(session_id: str) -> dict | None:
+    try:
+        value = await get_valkey_client().get(f"{REFRESH_KEY_PREFIX}{session_id}:token")
+    except RedisError as e:
+        logger.warning("Failed to load refreshed token: {}", e)
+        return None
+    return json.loads(value) if value else None
+
+
+@upstream_call("token_refresh")
+async def refresh_shared_token(session_id: str, token: dict) -> dict | None:
+    lock = get_valkey_client().lock(f"{REFRESH_KEY_PREFIX}{session_id}:lock", timeout=REFRESH_LOCK_TIMEOUT)
+    if not await lock.acquire(blocking=False):
+        return None
+    try:
+        shared_token = await load_shared_token(session_id)
+        if shared_token and shared_token["expires_at"] > token["expires_at"]:
+            return shared_token
+        logger.trace("Refreshing access token for session {}", session_id)
+        new_token = await oauth.keycloak.fetch_access_token(
+            grant_type="refresh_token", refresh_token=token["refresh_token"]
+        )
+        new_token = merge_refreshed_token(token, new_token)
+        # Kept as long as the refresh token, so requests with an older session copy can still pick it up
+        await get_valkey_client().set(f"{REFRESH_KEY_PREFIX}{session_id}:token", json.dumps(new_token),
+                                ex=max(1, new_token["refresh_expires_at"] - int(time.time())))
+        return new_token
+    finally:
+        try:
+            await lock.release()
+        except RedisError as e:
+            logger.warning("Failed to release token refresh lock: {}", e)
+
+
+async def wait_for_shared_token(session_id: str, token: dict) -> dict | None:
+    deadline = time.monotonic() + REFRESH_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        new_token = await refresh_shared_token(session_id, token)
+        if new_token:
+            return new_token
+        await asyncio.sleep(REFRESH_POLL_INTERVAL)
+        shared_token = await load_shared_token(session_id)
+        if shared_token and shared_token["expires_at"] > token["expires_at"]:
+            return shared_token
+    return None
+
+
+async def background_refresh(session_id: str, token: dict) -> None:
+    try:
+        await refresh_shared_token(session_id, token)
+    except Exception as e:
+        logger.warning("Background token refresh failed for session {}: {}", session_id, e)
+
+
+def needs_refresh(token: dict) -> bool:
+    # Within this window a request refreshes the token, in the foreground or in the background
+    return token["expires_at"] - time.time() <= max(REFRESH_LEEWAY, BACKGROUND_REFRESH_WINDOW)
+
+
+async def ensure_fresh_token(request: Request) -> dict:
+    token = request.session.get("token")
+    if not needs_refresh(token):
+        return token
+    remaining = token["expires_at"] - time.time()
+    session_id = get_session_id(request)
+    shared_token = await load_shared_token(session_id)
+    if shared_token and shared_token["expires_at"] > token["expires_at"]:
+        logger.trace("Using token refreshed by another request for session {}", session_id)
+        request.session["token"] = shared_token
+        return shared_token
+    if remaining > REFRESH_LEEWAY:
+        task = asyncio.create_task(background_refresh(session_id, token))
+        background_refreshes.add(task)
+        task.add_done_callback(background_refreshes.discard)
+        return token
+    try:
+        # Shielded, a cancelled request must not abandon a refresh halfway, the result is shared with the session
+        new_token = await asyncio.shield(wait_for_shared_token(session_id, token))
+    except Exception as e:
+        logger.warning("Token refresh failed for session {}: {}", session_id, e)
+        new_token = None
+    if new_token is None:
+        # Leave it to authlib to refresh the token lazily
+        return token
+    request.session["token"] = new_token
+    return new_token
 
 
 async def fetch_token(request: Request):
     logger.trace("Fetching token from session {}", request.cookies.get("session"))
-    token = request.session.get("token")
+    token = await ensure_fresh_token(request)
     return dict(
         access_token=token["access_token"],
         token_type=token["token_type"],
@@ -22,36 +133,39 @@ async def fetch_token(request: Request):
 async def update_token(token, access_token=None, refresh_token=None):
     logger.trace("Session access token expired")
     session = request_context.get().session
-    userinfo = session["token"]["userinfo"]
-    token["userinfo"] = userinfo
-    token["refresh_expires_at"] = int(time.time()) + token["expires_in"]
-    session["token"] = token
+    session["token"] = merge_refreshed_token(session["token"], token)
 
 
 oauth = OAuth()
 
-headers = {}
-if not is_local_config():
-    headers = {
-        "X-Forwarded-Proto": "https",
-        "Host": service_config.get("authorizationServerHost")
-    }
-
-oauth.register(
-    name="keycloak",
-    client_id=service_config.get("applicationClientId"),
-    client_secret=secrets.get(service_config.get("applicationClientSecretName")),
-    access_token_url=service_config.get("authorizationServerTokenUri"),
-    refresh_token_url=service_config.get("authorizationServerTokenUri"),
-    authorize_url=service_config.get("authorizationServerUri"),
-    api_base_url=service_config.get("todoApiBaseUrl"),
-    jwks_uri=service_config.get("authorizationServerJwksUri"),
-    fetch_token=fetch_token,
-    update_token=update_token,
-    client_kwargs={
-        "scope": "openid email profile",
-        "code_challenge_method": "S256",
-        "issuer": service_config.get("authorizationServerIssuerUri"),
-        "headers" : headers,
-    }
-)
+
+def register_oauth() -> None:
+    # Needs the client secret and the upstream transport, so it runs during startup once both are there
+    headers = {}
+    if not is_local_config():
+        headers = {
+            "X-Forwarded-Proto": "https",
+            "Host": service_config.get("authorizationServerHost")
+        }
+
+    oauth.register(
+        name="keycloak",
+        client_id=service_config.get("applicationClientId"),
+        client_secret=secrets.get(service_config.get("applicationClientSecretName")),
+        access_token_url=service_config.get("authorizationServerTokenUri"),
+        refresh_token_url=service_config.get("authorizationServerTokenUri"),
+        authorize_url=service_config.get("authorizationServerUri"),
+        api_base_url=service_config.get("todoApiBaseUrl"),
+        jwks_uri=service_config.get("authorizationServerJwksUri"),
+        fetch_token=fetch_token,
+        update_token=update_token,
+        client_kwargs={
+            "scope": "openid email profile",
+            "code_challenge_method": "S256",
+            "issuer": service_config.get("authorizationServerIssuerUri"),
+            "headers" : headers,
+            "transport": get_upstream_transport(),
+            "timeout": upstream_timeout,
+        },
+        overwrite=True
+    )
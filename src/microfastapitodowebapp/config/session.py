@@ -0,0 +1,195 @@
+import asyncio
+import contextvars
+import json
+import time
+import typing
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from loguru import logger
+from redis.exceptions import RedisError
+from starsessions.serializers import Serializer
+from redis.asyncio import Redis
+from starsessions.stores.redis import RedisStore
+
+from microfastapitodowebapp.config.metrics import session_store_duration
+
+FORMAT_VERSION: bytes = b"\x01"
+TOKEN_FIELDS = ("access_token", "token_type", "refresh_token", "expires_at", "refresh_expires_at")
+USERINFO_FIELDS = ("sub",)
+METADATA_FIELDS = ("lifetime", "created")
+
+INVALIDATION_CHANNEL: str = "starsessions.invalidate"
+
+loaded_session = contextvars.ContextVar("loaded_session", default=None)
+
+
+def compact_token(token: dict) -> dict:
+    result = {key: token[key] for key in TOKEN_FIELDS if key in token}
+    userinfo = token.get("userinfo") or {}
+    result["userinfo"] = {key: userinfo[key] for key in USERINFO_FIELDS if key in userinfo}
+    return result
+
+
+class CompactSessionSerializer(Serializer):
+    def serialize(self, data: typing.Any) -> bytes:
+        data = dict(data)
+        if "token" in data:
+            data["token"] = compact_token(data["token"])
+        if "__metadata__" in data:
+            # last_access changes on every load, dropping it keeps unchanged sessions byte-identical
+            data["__metadata__"] = {key: data["__metadata__"][key] for key in METADATA_FIELDS
+                                    if key in data["__metadata__"]}
+        encoded = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        return FORMAT_VERSION + zlib.compress(encoded)
+
+    def deserialize(self, data: bytes) -> typing.Dict[str, typing.Any]:
+        if not data:
+            return {}
+        if data[:1] == FORMAT_VERSION:
+            return json.loads(zlib.decompress(data[1:]))
+        # Sessions written by the plain JSON serializer before the switch
+        return json.loads(data)
+
+
+class DirtyTrackingRedisStore(RedisStore):
+    async def read(self, session_id: str, lifetime: int) -> bytes:
+        with session_store_duration.labels(operation="read").time():
+            value = await super().read(session_id, lifetime)
+        loaded_session.set((session_id, value))
+        return value
+
+    async def write(self, session_id: str, data: bytes, lifetime: int, ttl: int) -> str:
+        if loaded_session.get() == (session_id, data) and lifetime != 0:
+            with session_store_duration.labels(operation="renew").time():
+                renewed = await self._connection.expire(self.prefix(session_id), max(1, ttl))
+            if renewed:
+                logger.trace("Session {} unchanged, renewed TTL only", session_id)
+                return session_id
+        with session_store_duration.labels(operation="write").time():
+            return await super().write(session_id, data, lifetime, ttl)
+
+    async def remove(self, session_id: str) -> None:
+        with session_store_duration.labels(operation="remove").time():
+            await super().remove(session_id)
+
+
+@dataclass
+class CachedSession:
+    data: bytes
+    expires: float
+    # When this process last wrote or renewed the session in Valkey, None if it only read it
+    renewed: float | None = None
+
+
+class CachedSessionStore(DirtyTrackingRedisStore):
+    def __init__(self, *args, max_entries: int = 10000, max_age: int = 30, renew_after: float = 0.1,
+                 pubsub_connection: Redis | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.renew_after = renew_after
+        # The asyncio cluster client has no pub/sub, it runs over a separate connection there
+        self.pubsub_connection = pubsub_connection or self._connection
+        self.instance_id = uuid.uuid4().hex
+        self.cache: OrderedDict[str, CachedSession] = OrderedDict()
+        self.listener: asyncio.Task | None = None
+        self.subscribed = False
+
+    @property
+    def enabled(self) -> bool:
+        # Without a live subscription cached sessions could miss invalidations
+        return self.max_entries > 0 and self.subscribed
+
+    def put(self, session_id: str, data: bytes, renewed: float | None) -> None:
+        self.cache[session_id] = CachedSession(data, time.monotonic() + self.max_age, renewed)
+        self.cache.move_to_end(session_id)
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    def is_renewal_due(self, session_id: str, data: bytes, ttl: int) -> bool:
+        entry = self.cache.get(session_id) if self.enabled else None
+        if entry is None or entry.data != data or entry.renewed is None:
+            return True
+        return time.monotonic() - entry.renewed >= ttl * self.renew_after
+
+    async def read(self, session_id: str, lifetime: int) -> bytes:
+        entry = self.cache.get(session_id) if self.enabled else None
+        if entry and entry.expires > time.monotonic():
+            self.cache.move_to_end(session_id)
+            loaded_session.set((session_id, entry.data))
+            return entry.data
+        value = await super().read(session_id, lifetime)
+        if self.enabled and value:
+            # An expired entry still knows when the session was last renewed
+            self.put(session_id, value, entry.renewed if entry and entry.data == value else None)
+        return value
+
+    async def write(self, session_id: str, data: bytes, lifetime: int, ttl: int) -> str:
+        changed = loaded_session.get() != (session_id, data)
+        # A rolling session would otherwise cost an EXPIRE on every request, even when served from the cache
+        if not changed and lifetime != 0 and not self.is_renewal_due(session_id, data, ttl):
+            logger.trace("Session {} unchanged and renewed recently, skipping Valkey", session_id)
+            return session_id
+        session_id = await super().write(session_id, data, lifetime, ttl)
+        if self.enabled:
+            self.put(session_id, data, time.monotonic())
+        if changed and self.max_entries > 0:
+            await self.publish(session_id)
+        return session_id
+
+    async def remove(self, session_id: str) -> None:
+        await super().remove(session_id)
+        self.cache.pop(session_id, None)
+        if self.max_entries > 0:
+            await self.publish(session_id)
+
+    async def publish(self, session_id: str) -> None:
+        # Other workers may hold the session even while this one is not subscribed
+        try:
+            await self.pubsub_connection.publish(INVALIDATION_CHANNEL, f"{self.instance_id}:{session_id}")
+        except Exception as e:
+            logger.warning("Failed to publish session invalidation: {}", e)
+
+    async def listen(self) -> None:
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.pubsub_connection.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything cached before the subscription may have missed an invalidation
+                self.cache.clear()
+                self.subscribed = True
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    instance_id, _, session_id = message["data"].decode().partition(":")
+                    if instance_id != self.instance_id:
+                        self.cache.pop(session_id, None)
+            except Exception as e:
+                logger.warning("Session invalidation listener failed, retrying: {}", e)
+                self.subscribed = False
+                self.cache.clear()
+                await asyncio.sleep(1)
+            finally:
+                self.subscribed = False
+                if pubsub is not None:
+                    await pubsub.aclose()
+
+    def start(self) -> None:
+        if self.max_entries > 0 and self.listener is None:
+            self.listener = asyncio.create_task(self.listen())
+
+    async def stop(self) -> None:
+        if self.listener is not None:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+            self.listener = None
+        self.cache.clear()
+        if self.pubsub_connection is not self._connection:
+            await self.pubsub_connection.aclose()
@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from fastapi.requests import Request
+from fastapi.staticfiles import StaticFiles
+from jinja2 import pass_context
+from loguru import logger
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.types import Scope
+
+from microfastapitodowebapp.config.configuration import service_config
+
+try:
+    import brotli
+except ImportError:
+    # Only needed by the build step, the variants are plain files at runtime
+    brotli = None
+
+STATIC_DIRECTORY: str = "src/resources/static"
+STATIC_BUILD_DIRECTORY: str | None = service_config.get("staticBuildDirectory", default=None)
+MANIFEST_FILE: str = "manifest.json"
+IMMUTABLE_CACHE_CONTROL: str = "public, max-age=31536000, immutable"
+COMPRESSIBLE_SUFFIXES: set[str] = {".css", ".js", ".json", ".map", ".svg", ".txt", ".html"}
+# Smaller files gain next to nothing from compression
+MIN_COMPRESS_SIZE: int = 1024
+# Preferred first when the client accepts several
+ENCODING_SUFFIXES: dict[str, str] = {"br": ".br", "gzip": ".gz"}
+
+
+def accepted_encodings(accept_encoding: str | None) -> set[str]:
+    encodings = set()
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        quality = params.strip().removeprefix("q=").strip()
+        if coding and quality not in ("0", "0.0", "0.00", "0.000"):
+            encodings.add(coding)
+    return encodings
+
+
+def hashed_name(path: str, content: bytes) -> str:
+    stem, suffix = os.path.splitext(path)
+    return f"{stem}.{hashlib.blake2b(content, digest_size=6).hexdigest()}{suffix}"
+
+
+def compress_variants(content: bytes) -> dict[str, bytes]:
+    variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(content, quality=11)
+    # A variant has to pay for itself, otherwise the original is served
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(content) * 0.9}
+
+
+def build_static_assets(source: str = STATIC_DIRECTORY, target: str | None = STATIC_BUILD_DIRECTORY) -> dict:
+    shutil.rmtree(target, ignore_errors=True)
+    manifest = {}
+    for file in sorted(Path(source).rglob("*")):
+        if not file.is_file():
+            continue
+        path = file.relative_to(source).as_posix()
+        content = file.read_bytes()
+        hashed = hashed_name(path, content)
+        variants = {}
+        if file.suffix in COMPRESSIBLE_SUFFIXES and len(content) >= MIN_COMPRESS_SIZE:
+            variants = compress_variants(content)
+        # The original name is kept as well for links that do not go through static_url
+        for name in (path, hashed):
+            os.makedirs(os.path.dirname(os.path.join(target, name)), exist_ok=True)
+            Path(target, name).write_bytes(content)
+        for encoding, data in variants.items():
+            Path(target, hashed + ENCODING_SUFFIXES[encoding]).write_bytes(data)
+        manifest[path] = {"path": hashed, "encodings": sorted(variants)}
+    Path(target, MANIFEST_FILE).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    if brotli is None:
+        logger.warning("brotli is not installed, only gzip variants were built")
+    return manifest
+
+
+def load_manifest() -> dict:
+    if not STATIC_BUILD_DIRECTORY:
+        return {}
+    try:
+        return json.loads(Path(STATIC_BUILD_DIRECTORY, MANIFEST_FILE).read_text())
+    except FileNotFoundError:
+        logger.warning("No static asset manifest in {}, serving {} unhashed", STATIC_BUILD_DIRECTORY,
+                       STATIC_DIRECTORY)
+        return {}
+
+
+manifest: dict = load_manifest()
+
+
+@pass_context
+def static_url(context, path: str) -> str:
+    request: Request = context["request"]
+    asset = manifest.get(path)
+    return str(request.url_for("static", path=asset["path"] if asset else path))
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    def __init__(self, asset_manifest: dict, **kwargs):
+        super().__init__(**kwargs)
+        # Hashed path -> encodings built for it
+        self.immutable = {asset["path"]: asset["encodings"] for asset in asset_manifest.values()}
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset_path = path.replace(os.sep, "/")
+        encodings = self.immutable.get(asset_path)
+        if encodings is None:
+            return await super().get_response(path, scope)
+
+        response = None
+        if encodings:
+            accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding"))
+            encoding = next((encoding for encoding in ENCODING_SUFFIXES if encoding in encodings and
+                             encoding in accepted), None)
+            if encoding is not None:
+                try:
+                    response = await super().get_response(path + ENCODING_SUFFIXES[encoding], scope)
+                except HTTPException:
+                    # Variant removed from the build directory, the original still works
+                    response = None
+                # The content type is guessed from the name without the .br / .gz suffix
+                if response is not None and response.status_code == 200:
+                    response.headers["Content-Encoding"] = encoding
+        if response is None:
+            response = await super().get_response(path, scope)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        if encodings:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def create_static_files() -> StaticFiles:
+    if manifest:
+        return PrecompressedStaticFiles(manifest, directory=STATIC_BUILD_DIRECTORY)
+    return StaticFiles(directory=STATIC_DIRECTORY)
+
+
+if __name__ == "__main__":
+    # Build step, run after the CSS is built
+    if not STATIC_BUILD_DIRECTORY:
+        sys.exit("staticBuildDirectory is not configured")
+    logger.info("Built {} static assets into {}", len(build_static_assets()), STATIC_BUILD_DIRECTORY)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import httpx
+from loguru import logger
+
+from microfastapitodowebapp.config.configuration import service_config
+from microfastapitodowebapp.config.metrics import upstream_duration, upstream_operation, upstream_pool_wait, \
+    upstream_responses
+
+
+# authlib creates a short-lived client for every call, they all share this connection pool
+class SharedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncHTTPTransport, slow_wait: float):
+        self.transport = transport
+        self.slow_wait = slow_wait
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        acquired = False
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict):
+            nonlocal acquired
+            # The first connection or protocol event fires once the pool handed out a connection
+            if not acquired:
+                acquired = True
+                self.record_wait(request, time.perf_counter() - started)
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        operation, host = upstream_operation.get(), request.url.host
+        status = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        except asyncio.CancelledError:
+            # The caller went away, httpcore drops the connection instead of reading a response nobody wants
+            status = "cancelled"
+            raise
+        finally:
+            # Time to response headers, the body is streamed by the caller
+            upstream_duration.labels(operation=operation, host=host).observe(time.perf_counter() - started)
+            upstream_responses.labels(operation=operation, host=host, status=status).inc()
+
+    def record_wait(self, request: httpx.Request, wait: float) -> None:
+        upstream_pool_wait.labels(host=request.url.host).observe(wait)
+        if wait >= self.slow_wait:
+            logger.debug("Waited {:.1f} ms for an upstream connection to {}", wait * 1000, request.url.host)
+
+    async def aclose(self) -> None:
+        # Called by every per-request client on exit, the pool itself is closed by close()
+        pass
+
+    async def close(self) -> None:
+        await self.transport.aclose()
+
+
+upstream_timeout = httpx.Timeout(
+    connect=service_config.get("upstreamConnectTimeoutSeconds", cast=float, default=5.0),
+    read=service_config.get("upstreamReadTimeoutSeconds", cast=float, default=10.0),
+    write=service_config.get("upstreamWriteTimeoutSeconds", cast=float, default=10.0),
+    pool=service_config.get("upstreamPoolTimeoutSeconds", cast=float, default=5.0),
+)
+
+upstream_transport: SharedTransport | None = None
+
+
+def start() -> None:
+    # Building the pool loads the CA bundle, the lifespan does that instead of the import
+    global upstream_transport
+    upstream_transport = SharedTransport(
+        httpx.AsyncHTTPTransport(
+            # h2 ships with httpx[http2], HTTP/2 is only used where the upstream offers it through ALPN
+            http2=str(service_config.get("upstreamHttp2", default="false")).lower() == "true",
+            limits=httpx.Limits(
+                max_connections=service_config.get("upstreamMaxConnections", cast=int, default=100),
+                max_keepalive_connections=service_config.get("upstreamMaxKeepaliveConnections", cast=int, default=20),
+                keepalive_expiry=service_config.get("upstreamKeepaliveExpirySeconds", cast=float, default=30.0),
+            ),
+        ),
+        slow_wait=service_config.get("upstreamSlowPoolWaitSeconds", cast=float, default=0.05),
+    )
+
+
+async def stop() -> None:
+    global upstream_transport
+    try:
+        await get_upstream_transport().close()
+    finally:
+        upstream_transport = None
+
+
+def get_upstream_transport() -> SharedTransport:
+    if upstream_transport is None:
+        raise RuntimeError("Upstream transport is not started")
+    return upstream_transport
@@ -1,29 +1,119 @@
+import typing
+
 from loguru import logger
 from redis.asyncio import Redis, RedisCluster
-from starsessions.stores.redis import RedisStore
+from redis.commands.core import AsyncScript
+from redis.credentials import CredentialProvider
+from starsessions.stores.base import SessionStore
 
 from microfastapitodowebapp.config.configuration import service_config, secrets, is_local_config
+from microfastapitodowebapp.config.session import CachedSessionStore
 
-valkey_client = None
 
-if is_local_config():
-    logger.debug("Using standalone Valkey configuration")
-    valkey_client = Redis(
-        host=service_config.get("valkeyHostname"),
-        port=service_config.get("valkeyPort"),
-        username=secrets.get(service_config.get("valkeyUsernameSecretName")),
-        password=secrets.get(service_config.get("valkeyPasswordSecretName"))
-    )
-else:
+class SecretCredentialProvider(CredentialProvider):
+    # Secrets are loaded during startup, after the client is created, and read on every new connection
+    def get_credentials(self):
+        username = secrets.get(service_config.get("valkeyUsernameSecretName"))
+        password = secrets.get(service_config.get("valkeyPasswordSecretName")) or ""
+        if username:
+            return username, password
+        return (password,)
+
+    async def get_credentials_async(self):
+        return self.get_credentials()
+
+
+valkey_client: Redis | RedisCluster | None = None
+pubsub_client: Redis | None = None
+valkey_store: CachedSessionStore | None = None
+
+
+def create_clients() -> tuple[Redis | RedisCluster, Redis | None]:
+    if is_local_config():
+        logger.debug("Using standalone Valkey configuration")
+        client = Redis(
+            host=service_config.get("valkeyHostname"),
+            port=service_config.get("valkeyPort"),
+            credential_provider=SecretCredentialProvider()
+        )
+        return client, None
     logger.debug("Using cluster Valkey configuration")
-    valkey_client = RedisCluster(
+    client = RedisCluster(
         ssl=str(service_config.get("valkeySsl")).lower() == "true",
         host=service_config.get("valkeyHostname"),
         port=service_config.get("valkeyPort"),
-        username=secrets.get(service_config.get("valkeyUsernameSecretName")),
-        password=secrets.get(service_config.get("valkeyPasswordSecretName")),
+        credential_provider=SecretCredentialProvider(),
         socket_timeout=2,
         require_full_coverage=False
     )
+    # The asyncio cluster client has neither pubsub() nor publish(), published messages reach the subscribers of
+    # every node, so one plain connection to the configured node carries the session invalidations
+    pubsub = Redis(
+        ssl=str(service_config.get("valkeySsl")).lower() == "true",
+        host=service_config.get("valkeyHostname"),
+        port=service_config.get("valkeyPort"),
+        credential_provider=SecretCredentialProvider()
+    )
+    return client, pubsub
+
+
+def start() -> None:
+    # Called by the lifespan, importing the app opens nothing
+    global valkey_client, pubsub_client, valkey_store
+    valkey_client, pubsub_client = create_clients()
+    valkey_store = CachedSessionStore(
+        connection=valkey_client,
+        max_entries=service_config.get("sessionCacheMaxEntries", cast=int, default=10000),
+        max_age=service_config.get("sessionCacheMaxAgeSeconds", cast=int, default=30),
+        # Fraction of the session lifetime after which an unchanged session's TTL is renewed again
+        renew_after=service_config.get("sessionRenewAfterFraction", cast=float, default=0.1),
+        pubsub_connection=pubsub_client
+    )
+    valkey_store.start()
+
+
+async def stop() -> None:
+    global valkey_client, pubsub_client, valkey_store
+    try:
+        # Closes the pub/sub connection as well
+        await get_valkey_store().stop()
+    finally:
+        await get_valkey_client().aclose()
+        valkey_client, pubsub_client, valkey_store = None, None, None
+
+
+def get_valkey_client() -> Redis | RedisCluster:
+    if valkey_client is None:
+        raise RuntimeError("Valkey client is not started")
+    return valkey_client
+
+
+def get_valkey_store() -> CachedSessionStore:
+    if valkey_store is None:
+        raise RuntimeError("Valkey session store is not started")
+    return valkey_store
+
+
+class LifespanSessionStore(SessionStore):
+    # The session middleware is built before the lifespan runs, the store behind it only exists after start()
+    async def read(self, session_id: str, lifetime: int) -> bytes:
+        return await get_valkey_store().read(session_id, lifetime)
+
+    async def write(self, session_id: str, data: bytes, lifetime: int, ttl: int) -> str:
+        return await get_valkey_store().write(session_id, data, lifetime, ttl)
+
+    async def remove(self, session_id: str) -> None:
+        await get_valkey_store().remove(session_id)
+
+
+class LazyScript:
+    # Scripts are declared on import, they are registered with whichever client is running when first called
+    def __init__(self, script: str) -> None:
+        self.script = script
+        self.registered: tuple[Redis | RedisCluster, AsyncScript] | None = None
 
-valkey_store = RedisStore(connection=valkey_client)
+    async def __call__(self, keys: typing.Sequence, args: typing.Sequence) -> typing.Any:
+        client = get_valkey_client()
+        if self.registered is None or self.registered[0] is not client:
+            self.registered = (client, client.register_script(self.script))
+        return await self.registered[1](keys=keys, args=args)
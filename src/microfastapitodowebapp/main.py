@@ -1,41 +1,71 @@
+import asyncio
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from loguru import logger
 from starsessions import SessionMiddleware, SessionAutoloadMiddleware
 
-from microfastapitodowebapp.config import logging
+from microfastapitodowebapp.config import logging, upstream, valkey
+from microfastapitodowebapp.config.compression import CompressionMiddleware
+from microfastapitodowebapp.config.configuration import load_secrets
+from microfastapitodowebapp.config.jinja import precompile_templates
+from microfastapitodowebapp.config.metrics import MetricsMiddleware, mark_process_dead
 from microfastapitodowebapp.config.middleware import AuthGuardMiddleware, RequestContextMiddleware, \
-    HTMXRedirectMiddleware
-from microfastapitodowebapp.config.valkey import valkey_store, valkey_client
-from microfastapitodowebapp.router import landing, dashboard, auth
+    HTMXRedirectMiddleware, RequestCancellationMiddleware
+from microfastapitodowebapp.config.oauth import register_oauth
+from microfastapitodowebapp.config.session import CompactSessionSerializer
+from microfastapitodowebapp.config.static_assets import create_static_files
+from microfastapitodowebapp.router import landing, dashboard, auth, metrics
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    # Vault fetches block, the Valkey client only needs the secrets once it opens a connection
+    await asyncio.to_thread(load_secrets)
+    valkey.start()
+    upstream.start()
+    register_oauth()
+    # Compiled before the first request instead of during it
+    logger.info("Loaded {} templates.", precompile_templates())
+    logger.info("Application started in process {}.", os.getpid())
     yield
-    # Shutdown
-    logger.info("Application shutting down, closing Valkey client...")
-    await valkey_client.aclose()
-    logger.info("Valkey client closed.")
+    # Shutdown, uvicorn has drained the in-flight requests by now
+    logger.info("Application shutting down, closing pooled clients...")
+    # One failing close must not leave the others open
+    for name, close in (("Valkey clients", valkey.stop),
+                        ("Upstream connection pool", upstream.stop)):
+        try:
+            await close()
+            logger.info("{} closed.", name)
+        except Exception as e:
+            logger.error("Failed to close {}: {}", name, e)
+    mark_process_dead(os.getpid())
 
 app = FastAPI(lifespan=lifespan)
 # Config
 logging.setup_logging()
-app.mount("/static", StaticFiles(directory="src/resources/static"), name="static")
+app.mount("/static", create_static_files(), name="static")
 
 # Middleware
+# Innermost, a cancelled request still passes through the session and metrics middleware normally
+app.add_middleware(RequestCancellationMiddleware, supersedable_triggers=("todo_list",),
+                   cancellable_prefixes=("/dashboard/partials/",))
 app.add_middleware(RequestContextMiddleware)
 app.add_middleware(AuthGuardMiddleware, callback_endpoint_name="auth_callback",
-                   public_urls=["/", "/favicon.ico", "/login**", "/static/**"])
+                   public_urls=["/", "/favicon.ico", "/login**", "/static/**", "/metrics"])
 app.add_middleware(HTMXRedirectMiddleware)
 app.add_middleware(SessionAutoloadMiddleware)
-app.add_middleware(SessionMiddleware, store=valkey_store, lifetime=3600, rolling=True)
+app.add_middleware(SessionMiddleware, store=valkey.LifespanSessionStore(), serializer=CompactSessionSerializer(),
+                   lifetime=3600, rolling=True)
+# Static files are pre-compressed at build time
+app.add_middleware(CompressionMiddleware, excluded_prefixes=("/static/",))
+app.add_middleware(MetricsMiddleware)
 
 # Routers
 app.include_router(landing.router)
 app.include_router(dashboard.router)
 app.include_router(auth.router)
+app.include_router(metrics.router)
 
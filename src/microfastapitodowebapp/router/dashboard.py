@@ -1,15 +1,22 @@
+import asyncio
 from typing import Annotated
 
 from fastapi import APIRouter, Query, Depends, Form
 from fastapi.responses import HTMLResponse
 
+from microfastapitodowebapp.config.jinja import streaming_template_response
 from microfastapitodowebapp.domain.query import QueryMode, TodoQuery
+from microfastapitodowebapp.util.chart_helper import build_chart_data
+from microfastapitodowebapp.util.bulk_action_helper import run_bulk_action, create_bulk_response, \
+    validate_bulk_selection
+from microfastapitodowebapp.util.etag_helper import compute_etag, etag_headers, is_not_modified, not_modified_response
 from microfastapitodowebapp.util.todo_form_helper import *
 from microfastapitodowebapp.model.todo_response import TodoResponse, TodoStatistics
 from microfastapitodowebapp.service import (
     todo as todo_service,
     statistics as statistics_service,
-    share as share_service
+    share as share_service,
+    prefetch
 )
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
@@ -38,11 +45,15 @@ async def get_partial_todos(request: Request,
                             page_size: Annotated[int | None, Query(alias="pageSize")] = 20):
     query = TodoQuery(search, sort, page_number, page_size)
     todo_response: TodoResponse = await todo_service.get_todos(request, query, mode)
+    prefetch.schedule_adjacent(request, query, mode, todo_response.page)
+    etag = compute_etag(request, [todo.version for todo in todo_response.content], todo_response.page)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
     new_url = str(request.url_for("dashboard").include_query_params(**request.query_params))
-    return templates.TemplateResponse(
+    return streaming_template_response(
         request=request, name="partials/_todo_list.html",
         context={"todos": todo_response.content, "page": todo_response.page},
-        headers={"HX-Push-Url": new_url}
+        headers={"HX-Push-Url": new_url, **etag_headers(etag)}
     )
 
 
@@ -55,8 +66,50 @@ async def get_partial_statistics(request: Request,
                                  page_size: Annotated[int | None, Query(alias="pageSize")] = 20):
     query = TodoQuery(search, sort, page_number, page_size)
     todo_statistics: TodoStatistics = await statistics_service.get_simple_stats(request, query, mode)
+    etag = compute_etag(request, todo_statistics)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    return templates.TemplateResponse(
+        request=request, name="partials/_todo_statistics.html", context={"statistics": todo_statistics},
+        headers=etag_headers(etag)
+    )
+
+
+@router.get(path="/partials/charts", name="dashboard_charts", response_class=HTMLResponse)
+async def get_partial_charts(request: Request):
+    overview = await statistics_service.get_statistics_overview(request)
+    etag = compute_etag(request, overview)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
     return templates.TemplateResponse(
-        request=request, name="partials/_todo_statistics.html", context={"statistics": todo_statistics}
+        request=request, name="partials/_statistics_charts.html", context={"charts": build_chart_data(overview)},
+        headers=etag_headers(etag)
+    )
+
+
+@router.get(path="/partials/data", name="dashboard_data", response_class=HTMLResponse)
+async def get_partial_data(request: Request,
+                           search: str = None,
+                           sort: str = None,
+                           mode: QueryMode = QueryMode.OWN,
+                           page_number: Annotated[int | None, Query(alias="pageNumber")] = 0,
+                           page_size: Annotated[int | None, Query(alias="pageSize")] = 20):
+    query = TodoQuery(search, sort, page_number, page_size)
+    todo_response, todo_statistics = await asyncio.gather(
+        todo_service.get_todos(request, query, mode),
+        statistics_service.get_simple_stats(request, query, mode)
+    )
+    prefetch.schedule_adjacent(request, query, mode, todo_response.page)
+    etag = compute_etag(request, [todo.version for todo in todo_response.content], todo_response.page,
+                        todo_statistics)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    new_url = str(request.url_for("dashboard").include_query_params(**request.query_params))
+    return streaming_template_response(
+        request=request, name="partials/_dashboard_data.html",
+        context={"todos": todo_response.content, "page": todo_response.page, "statistics": todo_statistics},
+        headers={"HX-Push-Url": new_url, **etag_headers(etag)},
+        block_names=["todo_list", "todo_statistics"]
     )
 
 
@@ -71,12 +124,19 @@ async def get_new_todo_drawer(request: Request):
 
 @router.get("/partials/drawer/{todo_id}", name="drawer_update", response_class=HTMLResponse)
 async def get_edit_todo_drawer(request: Request, todo_id: int):
-    todo_item = await todo_service.get_todo_by_id(request, todo_id)
-    shares = await share_service.get_todo_shares(request, todo_id)
+    todo_item, shares = await asyncio.gather(
+        todo_service.get_todo_by_id(request, todo_id),
+        share_service.get_todo_shares(request, todo_id)
+    )
+    # Share changes do not touch the todo's updated_at
+    etag = compute_etag(request, todo_item.version, shares)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
     return templates.TemplateResponse(
         request=request,
         name="partials/_drawer_content.html",
-        context={"todo": todo_item, "share": shares}
+        context={"todo": todo_item, "share": shares},
+        headers=etag_headers(etag)
     )
 
 
@@ -89,6 +149,45 @@ async def create_todo_from_form(request: Request, todo_id: int, completed: Annot
         return create_toast_response(request, shares_ok=False, is_error=True, custom_message="Failed Todo Update")
     return create_toast_response(request, shares_ok=True, is_error=False, custom_message="Todo Updated")
 
+
+@router.post("/todos/bulk/complete", name="todo_bulk_complete", response_class=HTMLResponse)
+async def bulk_complete_todos(request: Request, todo_ids: Annotated[List[int] | None, Form()] = None):
+    return await bulk_patch_todos(request, todo_ids, TodoPatchNoDateRequest(priority=None, completed=True),
+                                  "completed")
+
+
+@router.post("/todos/bulk/uncomplete", name="todo_bulk_uncomplete", response_class=HTMLResponse)
+async def bulk_uncomplete_todos(request: Request, todo_ids: Annotated[List[int] | None, Form()] = None):
+    return await bulk_patch_todos(request, todo_ids, TodoPatchNoDateRequest(priority=None, completed=False),
+                                  "reopened")
+
+
+@router.post("/todos/bulk/priority", name="todo_bulk_priority", response_class=HTMLResponse)
+async def bulk_change_priority(request: Request, priority: Annotated[int, Form()],
+                               todo_ids: Annotated[List[int] | None, Form()] = None):
+    return await bulk_patch_todos(request, todo_ids, TodoPatchNoDateRequest(priority=priority), "updated")
+
+
+@router.post("/todos/bulk/delete", name="todo_bulk_delete", response_class=HTMLResponse)
+async def bulk_delete_todos(request: Request, todo_ids: Annotated[List[int] | None, Form()] = None):
+    invalid = validate_bulk_selection(request, todo_ids)
+    if invalid:
+        return invalid
+    result = await run_bulk_action(request, todo_ids,
+                                   lambda todo_id: todo_service.delete_todo(request, todo_id, invalidate=False))
+    return create_bulk_response(request, result, "deleted")
+
+
+async def bulk_patch_todos(request: Request, todo_ids: List[int] | None,
+                           patch_request: TodoPatchNoDateRequest, verb: str):
+    invalid = validate_bulk_selection(request, todo_ids)
+    if invalid:
+        return invalid
+    result = await run_bulk_action(request, todo_ids, lambda todo_id: todo_service.patch_todo(
+        request, todo_id, patch_request, invalidate=False))
+    return create_bulk_response(request, result, verb)
+
+
 @router.post("/todos/create", response_class=HTMLResponse)
 async def create_todo_from_form(request: Request,
                                 form_data: Annotated[TodoFormData, Depends()]):
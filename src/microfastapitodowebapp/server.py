@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+from microfastapitodowebapp.config.configuration import service_config
+
+APP: str = "microfastapitodowebapp.main:app"
+
+
+def worker_count() -> int:
+    # Defaults to the CPUs this process may run on, which follows the container's cpuset
+    return service_config.get("serverWorkers", cast=int, default=os.process_cpu_count() or 1)
+
+
+def prepare_metrics_directory() -> None:
+    # Workers write their metrics to files in this directory, a scrape of any worker merges all of them. It has to
+    # be set before a worker imports prometheus_client and emptied on start, files of an earlier run would be added.
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+
+def main() -> None:
+    prepare_metrics_directory()
+    # Workers are spawned and import the app themselves, so the Valkey client, the upstream pool and the Jinja
+    # environment are created per worker and bound to that worker's event loop
+    uvicorn.run(
+        APP,
+        host=service_config.get("serverHost", default="0.0.0.0"),
+        port=service_config.get("serverPort", cast=int, default=8080),
+        workers=worker_count(),
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        # SIGTERM stops accepting, in-flight requests get this long before the lifespan shutdown closes the pools
+        timeout_graceful_shutdown=service_config.get("serverGracefulShutdownSeconds", cast=int, default=20),
+        timeout_keep_alive=service_config.get("serverKeepAliveSeconds", cast=int, default=5),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import struct
+import time
+from typing import Awaitable, Callable
+from urllib.parse import urlencode
+
+from fastapi.requests import Request
+from loguru import logger
+from redis.exceptions import RedisError
+
+from microfastapitodowebapp.config.configuration import service_config
+from microfastapitodowebapp.config.metrics import todo_cache_errors, todo_cache_hits, todo_cache_invalidations, \
+    todo_cache_misses, todo_cache_prefetch_hits, todo_cache_prefetch_stores
+from microfastapitodowebapp.config.valkey import LazyScript, get_valkey_client
+from microfastapitodowebapp.domain.query import TodoQuery, QueryMode
+from microfastapitodowebapp.service import single_flight
+from microfastapitodowebapp.util.session_helper import get_user_id
+
+KEY_PREFIX: str = "todo-cache:"
+CACHE_TTL: int = service_config.get("todoCacheTtlSeconds", cast=int, default=5)
+PREFETCH_KEY_PREFIX: str = "todo-prefetch:"
+PREFETCH_TTL: int = service_config.get("todoPrefetchTtlSeconds", cast=int, default=30)
+# Prefetched values start with their expiry, the key's own expiry is pushed out by every new prefetch
+PREFETCH_EXPIRY = struct.Struct(">d")
+GENERATION_KEY_PREFIX: str = "todo-cache-generation:"
+# Only has to outlive the slowest fetch, an expired generation costs one dropped store
+GENERATION_TTL: int = 3600
+
+# KEYS: cache or prefetch hash, generation key. ARGV: field, value, ttl, generation the value was fetched at,
+# "1" to push out an existing expiry. A fetch that raced an invalidation, on any worker, would otherwise store
+# the old body after the delete.
+STORE_SCRIPT = LazyScript("""
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if ARGV[5] == '1' then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+else
+    redis.call('EXPIRE', KEYS[1], ARGV[3], 'NX')
+end
+return 1
+""")
+
+
+
+
+def build_key(user_id: str) -> str:
+    # Hash tag keeps every entry of a user on the same cluster slot
+    return f"{KEY_PREFIX}{{{user_id}}}"
+
+
+def build_prefetch_key(user_id: str) -> str:
+    # Same hash tag as the cache key, so both are read in one round trip and deleted together
+    return f"{PREFETCH_KEY_PREFIX}{{{user_id}}}"
+
+
+def build_generation_key(user_id: str) -> str:
+    return f"{GENERATION_KEY_PREFIX}{{{user_id}}}"
+
+
+def build_field(namespace: str, query: TodoQuery, query_mode: QueryMode) -> str:
+    params = sorted(query.to_dict().items())
+    return f"{namespace}:{query_mode.value}:{urlencode(params)}"
+
+
+async def lookup(user_id: str, field: str) -> tuple[bytes | None, bool, int]:
+    # Returns the cached value, whether it came from a prefetch and the generation it was looked up at
+    async with get_valkey_client().pipeline(transaction=False) as pipe:
+        pipe.hget(build_key(user_id), field)
+        pipe.get(build_generation_key(user_id))
+        if PREFETCH_TTL > 0:
+            pipe.hget(build_prefetch_key(user_id), field)
+        cached, generation, *prefetched = await pipe.execute()
+    generation = int(generation or 0)
+    if cached is not None or not prefetched or prefetched[0] is None:
+        return cached, False, generation
+    if PREFETCH_EXPIRY.unpack_from(prefetched[0])[0] < time.time():
+        return None, False, generation
+    return prefetched[0][PREFETCH_EXPIRY.size:], True, generation
+
+
+async def get_or_fetch(request: Request, namespace: str, query: TodoQuery, query_mode: QueryMode,
+                       fetch: Callable[[int], Awaitable[bytes]]) -> bytes:
+    # fetch gets the cache generation, requests for different generations must not share a response
+    if CACHE_TTL <= 0:
+        return await fetch(0)
+    user_id = get_user_id(request)
+    key = build_key(user_id)
+    field = build_field(namespace, query, query_mode)
+    try:
+        cached, prefetched, generation = await lookup(user_id, field)
+    except RedisError as e:
+        logger.warning("Todo cache lookup failed: {}", e)
+        todo_cache_errors.inc()
+        return await fetch(-1)
+    if cached is not None:
+        todo_cache_hits.inc()
+        todo_cache_prefetch_hits.inc(prefetched)
+        logger.trace("Todo cache hit {} {}", key, field)
+        return cached
+    todo_cache_misses.inc()
+    logger.trace("Todo cache miss {} {}", key, field)
+    content = await fetch(generation)
+    try:
+        if not await STORE_SCRIPT(keys=[key, build_generation_key(user_id)],
+                                  args=[field, content, CACHE_TTL, generation, "0"]):
+            logger.trace("Dropping todo cache store {} {}, the cache was invalidated meanwhile", key, field)
+    except RedisError as e:
+        logger.warning("Todo cache store failed: {}", e)
+        todo_cache_errors.inc()
+    return content
+
+
+async def is_cached(request: Request, namespace: str, query: TodoQuery, query_mode: QueryMode) -> bool:
+    try:
+        cached, _, _ = await lookup(get_user_id(request), build_field(namespace, query, query_mode))
+        return cached is not None
+    except RedisError as e:
+        logger.warning("Todo cache lookup failed: {}", e)
+        todo_cache_errors.inc()
+        return False
+
+
+async def current_generation(request: Request) -> int | None:
+    try:
+        return int(await get_valkey_client().get(build_generation_key(get_user_id(request))) or 0)
+    except RedisError as e:
+        logger.warning("Todo cache generation lookup failed: {}", e)
+        todo_cache_errors.inc()
+        return None
+
+
+async def store_prefetched(request: Request, namespace: str, query: TodoQuery, query_mode: QueryMode,
+                           content: bytes, generation: int) -> None:
+    user_id = get_user_id(request)
+    key = build_prefetch_key(user_id)
+    value = PREFETCH_EXPIRY.pack(time.time() + PREFETCH_TTL) + content
+    try:
+        if not await STORE_SCRIPT(keys=[key, build_generation_key(user_id)],
+                                  args=[build_field(namespace, query, query_mode), value, PREFETCH_TTL, generation,
+                                        "1"]):
+            logger.trace("Dropping prefetch for {}, the cache was invalidated meanwhile", user_id)
+            return
+        todo_cache_prefetch_stores.inc()
+    except RedisError as e:
+        logger.warning("Todo prefetch store failed: {}", e)
+        todo_cache_errors.inc()
+
+
+async def invalidate(request: Request) -> None:
+    user_id = get_user_id(request)
+    # Reads issued from now on must not join a request that started before the write
+    single_flight.detach(user_id)
+    if CACHE_TTL <= 0:
+        return
+    key = build_key(user_id)
+    try:
+        async with get_valkey_client().pipeline(transaction=False) as pipe:
+            pipe.delete(key, build_prefetch_key(user_id))
+            pipe.incr(build_generation_key(user_id))
+            pipe.expire(build_generation_key(user_id), GENERATION_TTL)
+            await pipe.execute()
+        todo_cache_invalidations.inc()
+        logger.trace("Todo cache invalidated {}", key)
+    except RedisError as e:
+        logger.warning("Todo cache invalidation failed: {}", e)
+        todo_cache_errors.inc()
@@ -0,0 +1,91 @@
+import asyncio
+from dataclasses import replace
+
+from fastapi.requests import Request
+from loguru import logger
+
+from microfastapitodowebapp.config.configuration import service_config
+from microfastapitodowebapp.config.metrics import upstream_call
+from microfastapitodowebapp.config.oauth import needs_refresh
+from microfastapitodowebapp.domain.query import TodoQuery, QueryMode
+from microfastapitodowebapp.model.page_info import PageInfo
+from microfastapitodowebapp.service import cache, single_flight
+from microfastapitodowebapp.service import statistics as statistics_service, todo as todo_service
+from microfastapitodowebapp.util.session_helper import get_user_id
+from microfastapitodowebapp.util.url_helper import build_url
+
+PREFETCH_ENABLED: bool = str(service_config.get("todoPrefetchEnabled", default="true")).lower() == "true"
+MAX_PREFETCHES_PER_USER: int = service_config.get("todoPrefetchMaxPerUser", cast=int, default=2)
+# A dashboard page is rendered from both, prefetching only the list would still cost a round trip per click
+TARGETS: tuple[tuple[str, str], ...] = (("todos", todo_service.BASE_PATH),
+                                        ("statistics", statistics_service.BASE_PATH))
+
+# User id -> todos URL of the page -> running prefetch
+running: dict[str, dict[str, asyncio.Task]] = {}
+
+
+def is_enabled() -> bool:
+    return PREFETCH_ENABLED and MAX_PREFETCHES_PER_USER > 0 and cache.CACHE_TTL > 0 and cache.PREFETCH_TTL > 0
+
+
+def adjacent_queries(query: TodoQuery, page: PageInfo) -> list[TodoQuery]:
+    current = query.page_number or 0
+    pages = [number for number in (current + 1, current - 1) if 0 <= number < page.total_pages]
+    return [replace(query, page_number=number) for number in pages]
+
+
+async def prefetch_target(request: Request, namespace: str, base_path: str, query: TodoQuery,
+                          query_mode: QueryMode, generation: int, token: dict) -> None:
+    if await cache.is_cached(request, namespace, query, query_mode):
+        return
+    response = await single_flight.get(request, build_url(base_path, query, query_mode), generation, token)
+    response.raise_for_status()
+    await cache.store_prefetched(request, namespace, query, query_mode, response.content, generation)
+
+
+@upstream_call("prefetch")
+async def prefetch_page(request: Request, query: TodoQuery, query_mode: QueryMode, token: dict) -> None:
+    # Kept in Valkey, a write handled by another worker has to stop this prefetch from storing as well
+    generation = await cache.current_generation(request)
+    if generation is None:
+        return
+    try:
+        await asyncio.gather(*(prefetch_target(request, namespace, base_path, query, query_mode, generation, token)
+                               for namespace, base_path in TARGETS))
+    except Exception as e:
+        logger.debug("Prefetch of page {} failed: {}", query.page_number, e)
+
+
+def schedule_adjacent(request: Request, query: TodoQuery, query_mode: QueryMode, page: PageInfo) -> None:
+    if not is_enabled():
+        return
+    # Prefetching must not be the one to refresh the token, its session changes are never saved
+    token = request.session["token"]
+    if needs_refresh(token):
+        return
+    user_id = get_user_id(request)
+    wanted = {build_url(todo_service.BASE_PATH, adjacent, query_mode): adjacent
+              for adjacent in adjacent_queries(query, page)}
+    user_prefetches = running.setdefault(user_id, {})
+    # The session moved on, prefetches for pages it no longer borders are wasted work
+    for key in [key for key in user_prefetches if key not in wanted]:
+        user_prefetches.pop(key).cancel()
+    for key, adjacent in wanted.items():
+        if key in user_prefetches:
+            continue
+        if len(user_prefetches) >= MAX_PREFETCHES_PER_USER:
+            break
+        task = asyncio.create_task(prefetch_page(request, adjacent, query_mode, token))
+        user_prefetches[key] = task
+        task.add_done_callback(lambda done, key=key: forget(user_id, key, done))
+    if not user_prefetches:
+        del running[user_id]
+
+
+def forget(user_id: str, key: str, task: asyncio.Task) -> None:
+    user_prefetches = running.get(user_id)
+    if user_prefetches is None or user_prefetches.get(key) is not task:
+        return
+    del user_prefetches[key]
+    if not user_prefetches:
+        del running[user_id]
@@ -0,0 +1,64 @@
+import asyncio
+from dataclasses import dataclass
+
+from fastapi.requests import Request
+from httpx import Response
+from loguru import logger
+
+from microfastapitodowebapp.config.oauth import oauth, needs_refresh
+from microfastapitodowebapp.util.session_helper import get_user_id
+
+
+@dataclass
+class Flight:
+    task: asyncio.Task
+    waiters: int = 0
+    # Started with a copied token instead of its caller's session, see get()
+    background: bool = False
+
+
+# User id, URL, cache generation -> running request
+in_flight: dict[tuple[str, str, int], Flight] = {}
+
+
+def forget(key: tuple[str, str, int], flight: Flight) -> None:
+    if in_flight.get(key) is flight:
+        del in_flight[key]
+
+
+def detach(user_id: str) -> None:
+    # Running requests finish for their callers, later calls start their own
+    for key in [key for key in in_flight if key[0] == user_id]:
+        del in_flight[key]
+
+
+def can_join(request: Request, flight: Flight) -> bool:
+    # A foreground call refreshes a token close to expiry into its own session, joining a background call would skip
+    # that and leave any refresh to a session nobody saves
+    return not flight.background or not needs_refresh(request.session["token"])
+
+
+async def get(request: Request, url: str, generation: int = 0, token: dict | None = None) -> Response:
+    key = (get_user_id(request), url, generation)
+    flight = in_flight.get(key)
+    if flight is None or not can_join(request, flight):
+        if token is None:
+            call = oauth.keycloak.get(url, request=request)
+        else:
+            call = oauth.keycloak.get(url, token=token)
+        flight = Flight(asyncio.ensure_future(call), background=token is not None)
+        in_flight[key] = flight
+        flight.task.add_done_callback(lambda _: forget(key, flight))
+    else:
+        logger.trace("Joining in-flight request {}", url)
+    flight.waiters += 1
+    try:
+        # Shielded so a cancelled caller does not cancel the request for the others
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # Every caller was cancelled, nobody is left to use the response
+            logger.trace("Cancelling abandoned request {}", url)
+            forget(key, flight)
+            flight.task.cancel()
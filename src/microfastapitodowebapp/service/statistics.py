@@ -1,24 +1,53 @@
+import asyncio
+
 from fastapi.requests import Request
 
-from microfastapitodowebapp.config.oauth import oauth
+from microfastapitodowebapp.config.metrics import upstream_call
 from microfastapitodowebapp.domain.query import TodoQuery, QueryMode
-from microfastapitodowebapp.model.todo_response import TodoStatistics, GroupedTodoStatistics
+from microfastapitodowebapp.model.todo_response import TodoStatistics, GroupedTodoStatistics, TodoStatisticsOverview
+from microfastapitodowebapp.service import cache, single_flight, statistics_cache
 from microfastapitodowebapp.util.url_helper import build_url
 
 BASE_PATH: str = "/api/v1/todos/statistics"
 
 
+@upstream_call("get_simple_stats")
 async def get_simple_stats(request: Request, query: TodoQuery = TodoQuery(),
                            query_mode: QueryMode = QueryMode.ALL) -> TodoStatistics:
     url = build_url(BASE_PATH, query, query_mode)
-    response = await oauth.keycloak.get(url, request=request)
-    response.raise_for_status()
-    return TodoStatistics.from_dict(response.json())
+
+    async def fetch(generation: int) -> bytes:
+        response = await single_flight.get(request, url, generation)
+        response.raise_for_status()
+        return response.content
+
+    content = await cache.get_or_fetch(request, "statistics", query, query_mode, fetch)
+    return TodoStatistics.from_json(content)
 
 
+@upstream_call("get_grouped_stats")
 async def get_grouped_stats(request: Request, group_by: str, query: TodoQuery = TodoQuery(),
                             query_mode: QueryMode = QueryMode.ALL) -> GroupedTodoStatistics:
     url = build_url(BASE_PATH, query, query_mode, {"groupBy": group_by})
-    response = await oauth.keycloak.get(url, request=request)
+    response = await single_flight.get(request, url)
     response.raise_for_status()
-    return GroupedTodoStatistics.from_dict(response.json())
+    return GroupedTodoStatistics.from_json(response.content)
+
+
+async def get_statistics_overview(request: Request) -> TodoStatisticsOverview:
+    # Kept up to date by the app's own writes, seeded from the grouped statistics once the aggregate expired
+    counts, version = await statistics_cache.load(request)
+    if counts is None:
+        # Dropped instead of stored when a todo changes meanwhile, the next request seeds it again
+        counts = await statistics_cache.replace(request, await get_own_counts(request), version)
+    return TodoStatisticsOverview.from_counts(counts)
+
+
+async def get_own_counts(request: Request) -> dict[str, int]:
+    # Three calls whatever the number of todos
+    overall, by_priority, by_category = await asyncio.gather(
+        get_simple_stats(request, query_mode=QueryMode.OWN),
+        get_grouped_stats(request, "priority", query_mode=QueryMode.OWN),
+        get_grouped_stats(request, "category", query_mode=QueryMode.OWN),
+    )
+    return statistics_cache.build_counts(overall, by_priority, by_category)
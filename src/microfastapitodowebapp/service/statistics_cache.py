@@ -0,0 +1,162 @@
+import json
+
+from fastapi.requests import Request
+from loguru import logger
+from redis.exceptions import RedisError
+
+from microfastapitodowebapp.config.configuration import service_config
+from microfastapitodowebapp.config.valkey import LazyScript, get_valkey_client
+from microfastapitodowebapp.model.todo_response import GroupedTodoStatistics, Todo, TodoStatistics
+from microfastapitodowebapp.util.session_helper import get_user_id
+
+KEY_PREFIX: str = "todo-stats:"
+AGGREGATE_TTL: int = service_config.get("statisticsAggregateTtlSeconds", cast=int, default=300)
+# Only has to outlive the slowest rebuild, an expired version costs one dropped rebuild
+VERSION_TTL: int = 3600
+# Counted for every todo, so the counts hash exists even for a user without todos
+OVERALL_GROUP: str = "all"
+
+# KEYS: counts hash, todo state hash, version key. ARGV: todo id, new state (empty when deleted), "1" when created,
+# version ttl. The old state is subtracted and the new one added in one step, so concurrent changes from any worker
+# never lose an update. The counts are seeded from the grouped statistics, the state hash only knows the todos this
+# app wrote since, a change to any other todo drops the aggregate and the next view seeds it again. The version is
+# bumped even without an aggregate, a rebuild that was running meanwhile may have read the counts before this change.
+APPLY_CHANGE_SCRIPT = LazyScript("""
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local old = redis.call('HGET', KEYS[2], ARGV[1])
+if not old and ARGV[3] ~= '1' then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+local function count(state, amount)
+    local todo = cjson.decode(state)
+    local status = todo[2] and 'finished' or 'unfinished'
+    local groups = {'all:'}
+    -- A todo without a priority has no priority group, the same as in build_counts
+    if todo[1] ~= cjson.null then
+        table.insert(groups, 'priority:' .. todo[1])
+    end
+    for _, category in ipairs(todo[3]) do
+        table.insert(groups, 'category:' .. category)
+    end
+    for _, group in ipairs(groups) do
+        redis.call('HINCRBY', KEYS[1], group .. ':total', amount)
+        redis.call('HINCRBY', KEYS[1], group .. ':' .. status, amount)
+    end
+end
+if old then
+    count(old, -1)
+end
+if ARGV[2] ~= '' then
+    count(ARGV[2], 1)
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    redis.call('PEXPIRE', KEYS[2], redis.call('PTTL', KEYS[1]))
+else
+    redis.call('HDEL', KEYS[2], ARGV[1])
+end
+return 1
+""")
+
+# KEYS: counts hash, todo state hash, version key. ARGV: ttl, counts as JSON object, version read before the
+# statistics were fetched. A change since then is missing from the counts, storing them would keep it lost until the
+# aggregate expires.
+REPLACE_SCRIPT = LazyScript("""
+if tonumber(redis.call('GET', KEYS[3]) or '0') ~= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+for field, value in pairs(cjson.decode(ARGV[2])) do
+    redis.call('HSET', KEYS[1], field, value)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+""")
+
+
+def build_keys(user_id: str) -> list[str]:
+    # One hash tag, the scripts touch both keys and have to run on a single cluster slot
+    prefix = f"{KEY_PREFIX}{{{user_id}}}"
+    return [f"{prefix}:counts", f"{prefix}:todos", f"{prefix}:version"]
+
+
+def todo_state(todo: Todo) -> str:
+    return json.dumps([todo.priority, bool(todo.completed), todo.categories or []], separators=(",", ":"))
+
+
+def add_counts(counts: dict[str, int], group: str, statistics: TodoStatistics) -> None:
+    counts[f"{group}:total"] = statistics.total or 0
+    counts[f"{group}:finished"] = statistics.finished or 0
+    counts[f"{group}:unfinished"] = statistics.unfinished or 0
+
+
+def build_counts(overall: TodoStatistics, by_priority: GroupedTodoStatistics,
+                 by_category: GroupedTodoStatistics) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    add_counts(counts, f"{OVERALL_GROUP}:", overall)
+    for priority, statistics in by_priority.statistics.items():
+        # The script counts changes under the numeric priority and skips todos without one
+        if priority.lstrip("-").isdigit():
+            add_counts(counts, f"priority:{int(priority)}", statistics)
+    for category, statistics in by_category.statistics.items():
+        add_counts(counts, f"category:{category}", statistics)
+    return counts
+
+
+async def load(request: Request) -> tuple[dict[str, int] | None, int | None]:
+    # Returns the counts and the version a rebuild has to store them at, None for either when unavailable
+    if AGGREGATE_TTL <= 0:
+        return None, None
+    counts_key, _, version_key = build_keys(get_user_id(request))
+    try:
+        async with get_valkey_client().pipeline(transaction=False) as pipe:
+            pipe.hgetall(counts_key)
+            pipe.get(version_key)
+            counts, version = await pipe.execute()
+    except RedisError as e:
+        logger.warning("Statistics aggregate lookup failed: {}", e)
+        return None, None
+    return {field.decode(): int(value) for field, value in counts.items()} or None, int(version or 0)
+
+
+async def replace(request: Request, counts: dict[str, int], version: int | None) -> dict[str, int]:
+    if AGGREGATE_TTL <= 0 or version is None:
+        return counts
+    try:
+        stored = await REPLACE_SCRIPT(keys=build_keys(get_user_id(request)),
+                                      args=[AGGREGATE_TTL, json.dumps(counts), version])
+        if not stored:
+            logger.trace("Dropping statistics aggregate, a todo changed while it was fetched")
+    except RedisError as e:
+        logger.warning("Statistics aggregate store failed: {}", e)
+    return counts
+
+
+async def apply_change(request: Request, todo_id: int, todo: Todo | None, created: bool = False) -> None:
+    # todo is the state after the change, None once it is deleted
+    if AGGREGATE_TTL <= 0:
+        return
+    try:
+        await APPLY_CHANGE_SCRIPT(keys=build_keys(get_user_id(request)),
+                                  args=[str(todo_id), todo_state(todo) if todo else "", "1" if created else "0",
+                                        VERSION_TTL])
+    except RedisError as e:
+        # A skipped change would stay wrong until the next refresh, dropping the aggregate forces one
+        logger.warning("Statistics aggregate update failed, dropping it: {}", e)
+        await invalidate(request)
+
+
+async def invalidate(request: Request) -> None:
+    counts_key, todos_key, version_key = build_keys(get_user_id(request))
+    try:
+        # The version is bumped, not deleted, so a rebuild that is running meanwhile is dropped as well
+        async with get_valkey_client().pipeline(transaction=False) as pipe:
+            pipe.delete(counts_key, todos_key)
+            pipe.incr(version_key)
+            pipe.expire(version_key, VERSION_TTL)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning("Statistics aggregate invalidation failed: {}", e)
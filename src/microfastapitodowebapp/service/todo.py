@@ -1,51 +1,78 @@
 from fastapi.requests import Request
 from yarl import URL
 
+from microfastapitodowebapp.config.metrics import upstream_call
 from microfastapitodowebapp.config.oauth import oauth
 from microfastapitodowebapp.domain.query import TodoQuery, QueryMode
 from microfastapitodowebapp.model.todo_request import TodoCreateRequest, TodoUpdateRequest, TodoPatchRequest, TodoPatchNoDateRequest
 from microfastapitodowebapp.model.todo_response import TodoResponse, Todo
+from microfastapitodowebapp.service import cache, single_flight, statistics_cache
 from microfastapitodowebapp.util.url_helper import build_url
 
 BASE_PATH: str = "/api/v1/todos"
 
 
+@upstream_call("get_todos")
 async def get_todos(request: Request, query: TodoQuery = TodoQuery(),
                     query_mode: QueryMode = QueryMode.ALL) -> TodoResponse:
     url = build_url(BASE_PATH, query, query_mode)
-    response = await oauth.keycloak.get(str(url), request=request)
-    response.raise_for_status()
-    return TodoResponse.from_dict(response.json())
+
+    async def fetch(generation: int) -> bytes:
+        response = await single_flight.get(request, str(url), generation)
+        response.raise_for_status()
+        return response.content
+
+    content = await cache.get_or_fetch(request, "todos", query, query_mode, fetch)
+    return TodoResponse.from_json(content)
 
 
+@upstream_call("get_todo_by_id")
 async def get_todo_by_id(request: Request, todo_id: int) -> Todo:
     url = URL.build(path=f"{BASE_PATH}/{todo_id}")
-    response = await oauth.keycloak.get(str(url), request=request)
+    response = await single_flight.get(request, str(url))
     response.raise_for_status()
-    return Todo.from_dict(response.json())
+    return Todo.from_json(response.content)
 
 
+@upstream_call("create_todo")
 async def create_todo(request: Request, todo: TodoCreateRequest) -> Todo:
     response = await oauth.keycloak.post(BASE_PATH, json=todo.model_dump(mode="json"), request=request)
+    await cache.invalidate(request)
     response.raise_for_status()
-    return Todo.from_dict(response.json())
+    created = Todo.from_json(response.content)
+    await statistics_cache.apply_change(request, created.id, created, created=True)
+    return created
 
 
+@upstream_call("update_todo")
 async def update_todo(request: Request, todo_id: int, todo: TodoUpdateRequest) -> Todo:
     url = URL.build(path=f"{BASE_PATH}/{todo_id}")
     response = await oauth.keycloak.put(str(url), json=todo.model_dump(mode="json"), request=request)
+    await cache.invalidate(request)
     response.raise_for_status()
-    return Todo.from_dict(response.json())
+    updated = Todo.from_json(response.content)
+    await statistics_cache.apply_change(request, todo_id, updated)
+    return updated
 
 
-async def patch_todo(request: Request, todo_id: int, todo: TodoPatchRequest | TodoPatchNoDateRequest) -> Todo:
+@upstream_call("patch_todo")
+async def patch_todo(request: Request, todo_id: int, todo: TodoPatchRequest | TodoPatchNoDateRequest,
+                     invalidate: bool = True) -> Todo:
     url = URL.build(path=f"{BASE_PATH}/{todo_id}")
     response = await oauth.keycloak.patch(str(url), json=todo.model_dump(mode="json"), request=request)
+    if invalidate:
+        await cache.invalidate(request)
     response.raise_for_status()
-    return Todo.from_dict(response.json())
+    patched = Todo.from_json(response.content)
+    await statistics_cache.apply_change(request, todo_id, patched)
+    return patched
 
 
-async def delete_todo(request: Request, todo_id: int) -> None:
+@upstream_call("delete_todo")
+async def delete_todo(request: Request, todo_id: int, invalidate: bool = True) -> None:
     url = URL.build(path=f"{BASE_PATH}/{todo_id}")
     response = await oauth.keycloak.delete(str(url), request=request)
+    if invalidate:
+        await cache.invalidate(request)
     response.raise_for_status()
+    await statistics_cache.apply_change(request, todo_id, None)
@@ -0,0 +1,75 @@
+import json
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Awaitable, Callable, Dict, List
+
+from fastapi.requests import Request
+from fastapi.responses import Response
+from httpx import HTTPStatusError
+from loguru import logger
+
+from microfastapitodowebapp.config.configuration import service_config
+from microfastapitodowebapp.service import cache
+from microfastapitodowebapp.util.concurrency import gather_bounded
+from microfastapitodowebapp.util.todo_form_helper import create_toast_response, TODOS_CHANGED_EVENT
+
+BULK_ACTION_CONCURRENCY: int = service_config.get("bulkActionConcurrency", cast=int, default=8)
+BULK_ACTION_MAX_ITEMS: int = service_config.get("bulkActionMaxItems", cast=int, default=100)
+
+
+@dataclass
+class BulkActionResult:
+    succeeded: List[int] = field(default_factory=list)
+    failed: Dict[int, str] = field(default_factory=dict)
+
+
+def describe_error(error: Exception) -> str:
+    if isinstance(error, HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    return type(error).__name__
+
+
+async def run_bulk_action(request: Request,
+                          todo_ids: List[int],
+                          action: Callable[[int], Awaitable[object]]) -> BulkActionResult:
+    jobs = {todo_id: partial(action, todo_id) for todo_id in dict.fromkeys(todo_ids)}
+    try:
+        failures = await gather_bounded(jobs, BULK_ACTION_CONCURRENCY)
+    finally:
+        # The per-item calls skip the invalidation, one covers the whole batch
+        await cache.invalidate(request)
+
+    result = BulkActionResult()
+    for todo_id, error in failures.items():
+        if error is None:
+            result.succeeded.append(todo_id)
+        else:
+            logger.warning("Bulk action failed for todo {}: {}", todo_id, error)
+            result.failed[todo_id] = describe_error(error)
+    return result
+
+
+def create_bulk_response(request: Request, result: BulkActionResult, verb: str) -> Response:
+    total = len(result.succeeded) + len(result.failed)
+    if not result.failed:
+        message = f"{total} todo{'s' if total != 1 else ''} {verb}."
+    else:
+        message = f"{len(result.succeeded)} of {total} todos {verb}, {len(result.failed)} failed."
+    # The toast re-renders the dashboard once, the per-item outcome goes along as an HTMX event
+    response = create_toast_response(request, shares_ok=not result.failed, is_error=not result.succeeded,
+                                     custom_message=message)
+    events = {"bulkActionResult": {"succeeded": result.succeeded,
+                                   "failed": {str(todo_id): reason for todo_id, reason in result.failed.items()}}}
+    if result.succeeded:
+        events[TODOS_CHANGED_EVENT] = True
+    response.headers["HX-Trigger"] = json.dumps(events)
+    return response
+
+
+def validate_bulk_selection(request: Request, todo_ids: List[int]) -> Response | None:
+    if not todo_ids:
+        return create_toast_response(request, is_error=True, custom_message="No todos selected.")
+    if len(todo_ids) > BULK_ACTION_MAX_ITEMS:
+        return create_toast_response(request, is_error=True,
+                                     custom_message=f"Select at most {BULK_ACTION_MAX_ITEMS} todos at once.")
+    return None
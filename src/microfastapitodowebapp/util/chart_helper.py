@@ -0,0 +1,28 @@
+from microfastapitodowebapp.domain.priority import priority_levels
+from microfastapitodowebapp.model.todo_response import GroupedTodoStatistics, TodoStatistics, TodoStatisticsOverview
+
+# The rest of the categories would not fit on a chart anyway
+MAX_CATEGORIES: int = 12
+
+
+def chart_series(labels: list[str], statistics: list[TodoStatistics]) -> dict:
+    return {
+        "type": "bar",
+        "labels": labels,
+        "finished": [item.finished for item in statistics],
+        "unfinished": [item.unfinished for item in statistics],
+    }
+
+
+def grouped_series(grouped: GroupedTodoStatistics, label, limit: int | None = None) -> dict:
+    items = list(grouped.statistics.items())[:limit]
+    return chart_series([label(key) for key, _ in items], [value for _, value in items])
+
+
+def build_chart_data(overview: TodoStatisticsOverview) -> dict:
+    return {
+        "chart_completion": chart_series(["All todos"], [overview.overall]),
+        "chart_priority": grouped_series(overview.by_priority,
+                                         lambda key: priority_levels.get(int(key), key) if key.isdigit() else key),
+        "chart_category": grouped_series(overview.by_category, lambda key: key, MAX_CATEGORIES),
+    }
@@ -0,0 +1,20 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+async def gather_bounded(jobs: Dict[K, Callable[[], Awaitable[object]]],
+                         limit: int) -> Dict[K, Optional[Exception]]:
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(job: Callable[[], Awaitable[object]]) -> Optional[Exception]:
+        async with semaphore:
+            try:
+                await job()
+                return None
+            except Exception as e:
+                return e
+
+    results = await asyncio.gather(*(run(job) for job in jobs.values()))
+    return dict(zip(jobs.keys(), results))
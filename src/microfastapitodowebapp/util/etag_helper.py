@@ -0,0 +1,38 @@
+import hashlib
+
+from fastapi.requests import Request
+from fastapi.responses import Response
+
+from microfastapitodowebapp.config.jinja import template_version
+from microfastapitodowebapp.util.session_helper import get_user_id
+
+# Stored by the browser but revalidated on every use, the browser turns a 304 into the cached 200 for HTMX
+CACHE_CONTROL: str = "private, no-cache"
+
+
+def compute_etag(request: Request, *data) -> str:
+    # The rendered bytes depend on the templates, the URL (links, pagination, header text) and the data
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(template_version().encode("utf-8"))
+    digest.update(str(request.url).encode("utf-8"))
+    digest.update(get_user_id(request).encode("utf-8"))
+    digest.update(repr(data).encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def etag_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag))
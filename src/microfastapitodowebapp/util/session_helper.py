@@ -0,0 +1,5 @@
+from fastapi.requests import Request
+
+
+def get_user_id(request: Request) -> str:
+    return request.session["token"]["userinfo"]["sub"]
@@ -1,9 +1,11 @@
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Set
+from functools import partial
+from typing import List, Optional, Dict, Set, Callable, Awaitable
 from fastapi.requests import Request
 
 from httpx import HTTPStatusError
 
+from microfastapitodowebapp.config.configuration import service_config
 from microfastapitodowebapp.config.jinja import templates
 from microfastapitodowebapp.model.todo_form_data import TodoFormData
 from microfastapitodowebapp.model.todo_request import (
@@ -13,6 +15,10 @@ from microfastapitodowebapp.model.todo_request import (
     TodoShareRequest,
 )
 from microfastapitodowebapp.service import share as share_service
+from microfastapitodowebapp.util.concurrency import gather_bounded
+
+SHARE_SYNC_CONCURRENCY: int = service_config.get("shareSyncConcurrency", cast=int, default=8)
+TODOS_CHANGED_EVENT: str = "todosChanged"
 
 
 def normalize_list(value: Optional[List[str]] | Optional[List[int]]) -> list:
@@ -90,26 +96,34 @@ async def create_shares_from_form(request: Request,
     if not emails or not levels:
         return True
 
-    all_success = True
-
+    jobs: Dict[str, Callable[[], Awaitable[None]]] = {}
     for email, level in zip(emails, levels):
         clean_email = (email or "").strip()
         if not clean_email:
             continue
+        jobs[clean_email] = partial(share_service.create_todo_share, request, todo_id,
+                                    TodoShareRequest(email=clean_email, accessLevel=level))
 
-        try:
-            share_req = TodoShareRequest(email=clean_email, accessLevel=level)
-            await share_service.create_todo_share(request, todo_id, share_req)
-        except HTTPStatusError as e:
-            print(f"Failed to share with {clean_email}: {e.response.text}")
-            all_success = False
-        except Exception as e:
-            print(f"Failed to share with {clean_email}: {e}")
-            all_success = False
+    all_success = True
+    failures = await gather_bounded(jobs, SHARE_SYNC_CONCURRENCY)
+    for email, error in failures.items():
+        if error is None:
+            continue
+        if isinstance(error, HTTPStatusError):
+            print(f"Failed to share with {email}: {error.response.text}")
+        else:
+            print(f"Failed to share with {email}: {error}")
+        all_success = False
 
     return all_success
 
 
+async def replace_todo_share(request: Request, todo_id: int, share_req: TodoShareRequest) -> None:
+    # The API has no level update, the old share has to be gone before the new one is created
+    await share_service.delete_todo_share(request, todo_id, share_req.email)
+    await share_service.create_todo_share(request, todo_id, share_req)
+
+
 async def sync_shares_from_form(request: Request,
                                 todo_id: int,
                                 shares_email: Optional[List[str]],
@@ -144,34 +158,33 @@ async def sync_shares_from_form(request: Request,
         emails_to_delete = current_keys - target_keys
         emails_to_check = target_keys.intersection(current_keys)
 
+        jobs: Dict[str, Callable[[], Awaitable[None]]] = {}
         for email in emails_to_delete:
-            try:
-                await share_service.delete_todo_share(request, todo_id, email)
-            except Exception as e:
-                print(f"Failed to delete share {email}: {e}")
-                errors_occurred = True
+            jobs[email] = partial(share_service.delete_todo_share, request, todo_id, email)
 
         for email in emails_to_add:
-            try:
-                level = target_shares_map[email]
-                share_req = TodoShareRequest(email=email, accessLevel=level)
-                await share_service.create_todo_share(request, todo_id, share_req)
-            except Exception as e:
-                print(f"Failed to add share {email}: {e}")
-                errors_occurred = True
+            share_req = TodoShareRequest(email=email, accessLevel=target_shares_map[email])
+            jobs[email] = partial(share_service.create_todo_share, request, todo_id, share_req)
 
         for email in emails_to_check:
             new_level = target_shares_map[email]
             old_level = current_shares_map[email]
 
             if new_level != old_level:
-                try:
-                    await share_service.delete_todo_share(request, todo_id, email)
-                    share_req = TodoShareRequest(email=email, accessLevel=new_level)
-                    await share_service.create_todo_share(request, todo_id, share_req)
-                except Exception as e:
-                    print(f"Failed to update share level for {email}: {e}")
-                    errors_occurred = True
+                share_req = TodoShareRequest(email=email, accessLevel=new_level)
+                jobs[email] = partial(replace_todo_share, request, todo_id, share_req)
+
+        failures = await gather_bounded(jobs, SHARE_SYNC_CONCURRENCY)
+        for email, error in failures.items():
+            if error is None:
+                continue
+            if email in emails_to_delete:
+                print(f"Failed to delete share {email}: {error}")
+            elif email in emails_to_add:
+                print(f"Failed to add share {email}: {error}")
+            else:
+                print(f"Failed to update share level for {email}: {error}")
+            errors_occurred = True
 
     except Exception as e:
         print(f"Critical error during share sync: {e}")
@@ -194,7 +207,7 @@ def create_toast_response(request: Request,
         toast_type = "success"
         toast_msg = custom_message or "Your changes have been saved."
 
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
         request=request,
         name="dashboard/content.html",
         context={
@@ -202,3 +215,7 @@ def create_toast_response(request: Request,
             "toast_type": toast_type
         }
     )
+    if not is_error:
+        # Parts of the dashboard outside the re-rendered content, like the charts, reload on this event
+        response.headers["HX-Trigger"] = TODOS_CHANGED_EVENT
+    return response